@@ -0,0 +1,23 @@
+# config/logging_config.py
+import logging
+import orjson
+from config.settings import settings
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line; the message is only formatted once the record passes the level check"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return orjson.dumps(entry).decode('utf-8')
+
+def configure_logging():
+    """Install the JSON handler on the root logger at LOG_LEVEL (e.g. WARNING in production)"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(JSONFormatter())
+    logging.basicConfig(level=settings.LOG_LEVEL, handlers=[handler], force=True)
@@ -6,5 +6,23 @@ load_dotenv()
 
 class Settings:
     OPENAI_API_KEY = os.getenv("OPEN_AI_KEY")
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    # bcrypt cost factor (2^rounds iterations); 12 is bcrypt's default. Each +1 doubles hash time.
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    # Threads hashing passwords in this process: its share of the cores when WEB_CONCURRENCY
+    # worker processes run side by side, so all workers together stay at the core count
+    BCRYPT_THREADS = int(os.getenv(
+        "BCRYPT_THREADS", max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY") or 1))
+    ))
+    # Azure OpenAI deployment per task. Captions and titles are short, simple outputs: point
+    # them at a smaller deployment (e.g. gpt-4o-mini) to cut their cost and latency
+    STORY_MODEL = os.getenv("STORY_MODEL", "gpt-4o")
+    SENTIMENT_MODEL = os.getenv("SENTIMENT_MODEL", "gpt-4o")
+    CAPTION_MODEL = os.getenv("CAPTION_MODEL", "gpt-4o")
+    TITLE_MODEL = os.getenv("TITLE_MODEL", "gpt-4o")
+    # Read through DateMsIndex, MoodDateIndex, FavoritesIndex and ContentHashIndex. Turn on only
+    # after `python migrations.py create-indexes` and `backfill-index-keys` have run; until then
+    # queries use the original DateIndex/MoodIndex and entries aren't deduplicated
+    DYNAMO_NEW_INDEXES = os.getenv("DYNAMO_NEW_INDEXES", "false").lower() in ("1", "true", "yes")
 
 settings = Settings()
\ No newline at end of file
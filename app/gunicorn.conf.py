@@ -0,0 +1,22 @@
+# gunicorn.conf.py
+# Production entry point, run from the app directory:
+#   gunicorn -c gunicorn.conf.py http_server:app
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# Each Uvicorn worker runs its own event loop, so independent clients never queue
+# behind one another. One async worker per core is enough to keep the cores busy (2*CPU+1
+# is the sizing rule for sync workers); more would also multiply the per-worker bcrypt pools
+# beyond the core count. WEB_CONCURRENCY overrides it.
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Workers inherit this, so each sizes its bcrypt pool to its share of the cores
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"  # picks up uvloop and httptools when installed
+
+# A memoir runs several model round trips back to back; don't recycle a worker mid-request
+timeout = 120
+graceful_timeout = 30
+# Reuse client connections across requests; longer than a typical load balancer's idle timeout (60s)
+keepalive = 75
@@ -1,676 +1,835 @@
-from flask import Flask, request, jsonify
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException as StarletteHTTPException
 import asyncio
-import json
 import logging
-from tools.image_captioning import ImageCaptioningTool
+import orjson
+import uvicorn
+from typing import List, Optional, get_args
+from tools.image_captioning import ImageCaptioningTool, decode_image_data, encode_image_data
 from tools.story_generation import StoryGenerationTool
 from tools.story_analysis import StoryAnalysisTool
-from tools.database_service import DatabaseService
-import bcrypt
-import secrets
+from tools.database_service import DatabaseService, count_words
+from tools.http_client import SHARED_HTTP
+from tools.circuit_breaker import CircuitBreaker, CircuitOpenError
+from tools.cache import content_key
+from tools.image_hashing import dhash, group_near_duplicates
+from schemas import (
+    AnalyzeSentimentRequest, CaptionImageRequest, ChangePasswordRequest, CreateUserRequest,
+    FavoriteUpdateRequest, GenerateStoryRequest, GenerateTitleRequest, ImageInput,
+    ImageFormat, LoginRequest, MemoirCreateRequest, RegisterRequest, Tone
+)
+from config.logging_config import configure_logging
+from decimal import Decimal
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-
 # Initialize tools
 image_captioner = ImageCaptioningTool()
 story_generator = StoryGenerationTool()
 story_analyzer = StoryAnalysisTool()
 db_service = DatabaseService()
 
-def run_async(coro):
-    """Helper to run async functions in Flask"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await db_service.connect()
+    yield
+    await db_service.close()
+    await SHARED_HTTP.aclose()
+
+class ORJSONRequest(Request):
+    """Request that decodes JSON bodies with orjson instead of the stdlib json module"""
+    async def json(self):
+        if not hasattr(self, '_json'):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+class ORJSONRoute(APIRoute):
+    """Route class that hands its handler an ORJSONRequest"""
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def orjson_handler(request: Request):
+            return await handler(ORJSONRequest(request.scope, request.receive))
 
-@app.route('/health', methods=['GET'])
-def health_check():
+        return orjson_handler
+
+# orjson on both sides: request bodies are parsed by ORJSONRequest, responses encoded by ORJSONResponse
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.router.route_class = ORJSONRoute
+
+# Sentiment and title are optional: while the provider keeps failing, skip straight to the defaults
+sentiment_breaker = CircuitBreaker('sentiment', failure_threshold=5, reset_timeout=60)
+title_breaker = CircuitBreaker('title', failure_threshold=5, reset_timeout=60)
+
+# Fallback used whenever sentiment analysis fails
+DEFAULT_SENTIMENT = {
+    'primary_mood': 'neutral',
+    'emotional_intensity': 5,
+    'overall_sentiment': 'neutral'
+}
+
+@app.get('/health')
+async def health_check():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
+    database_ok = await db_service.ping()
+    return ORJSONResponse({
+        'status': 'healthy' if database_ok else 'degraded',
         'service': 'memoir-ai-server',
         'version': '1.0.0',
-        'database': 'connected'
-    })
+        'database': 'connected' if database_ok else 'unavailable'
+    }, status_code=200 if database_ok else 503)
 
 # ==================================================================================
 # INDIVIDUAL AI TOOLS (existing endpoints)
 # ==================================================================================
 
-@app.route('/tools/caption_image', methods=['POST'])
-def caption_image_endpoint():
+@app.post('/tools/caption_image')
+async def caption_image_endpoint(data: CaptionImageRequest):
     """Caption an image"""
     try:
-        data = request.json
         logger.info("Processing image caption request")
-        
-        if not data or 'image_data' not in data:
-            return jsonify({'error': 'image_data is required'}), 400
-        
-        result = run_async(
-            image_captioner.caption_image(
-                data['image_data'], 
-                data.get('image_format', 'jpeg')
-            )
-        )
-        
+
+        if data.image_url:
+            # Already hosted: let the model fetch it rather than relaying the bytes
+            result = await image_captioner.caption_image_url(data.image_url)
+        elif data.image_data:
+            result = await image_captioner.caption_image(data.image_data, data.image_format)
+        else:
+            return ORJSONResponse({'error': 'image_data or image_url is required'}, status_code=400)
+
         logger.info("Image caption generated successfully")
-        return jsonify({'result': result})
-        
+        return {'result': result}
+
     except Exception as e:
-        logger.error(f"Error in caption_image: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error in caption_image: %s", e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
 
-@app.route('/tools/generate_story', methods=['POST'])
-def generate_story_endpoint():
+@app.post('/tools/generate_story')
+async def generate_story_endpoint(data: GenerateStoryRequest):
     """Generate a story from captions"""
     try:
-        data = request.json
         logger.info("Processing story generation request")
-        
-        if not data or 'captions' not in data:
-            return jsonify({'error': 'captions array is required'}), 400
-        
-        result = run_async(
-            story_generator.generate_story(
-                data['captions'],
-                data.get('user_context', ''),
-                data.get('tone', 'heartwarming')
-            )
-        )
-        
+
+        result = await story_generator.generate_story(data.captions, data.user_context, data.tone)
+
         logger.info("Story generated successfully")
-        return jsonify({'result': result})
-        
+        return {'result': result}
+
     except Exception as e:
-        logger.error(f"Error in generate_story: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error in generate_story: %s", e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
 
-@app.route('/tools/analyze_story_sentiment', methods=['POST'])
-def analyze_sentiment_endpoint():
+async def story_events(first_chunk, chunks):
+    """Encode story chunks as server-sent events, ending with a done (or error) event"""
+    try:
+        yield b'data: ' + orjson.dumps({'delta': first_chunk}) + b'\n\n'
+        async for chunk in chunks:
+            yield b'data: ' + orjson.dumps({'delta': chunk}) + b'\n\n'
+        yield b'event: done\ndata: {}\n\n'
+    except Exception as e:
+        # Headers are already sent; report the failure in-band
+        logger.error("Error streaming story: %s", e)
+        yield b'event: error\ndata: ' + orjson.dumps({'error': str(e)}) + b'\n\n'
+    finally:
+        await chunks.aclose()
+
+@app.post('/tools/generate_story/stream')
+async def generate_story_stream_endpoint(data: GenerateStoryRequest):
+    """Generate a story from captions, sent as server-sent events while the model writes it"""
+    try:
+        logger.info("Processing streaming story generation request")
+
+        chunks = story_generator.stream_story(data.captions, data.user_context, data.tone)
+        # Wait for the first chunk before committing to a 200 so failures still get an error response
+        first_chunk = await anext(chunks, '')
+        return StreamingResponse(story_events(first_chunk, chunks), media_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache'})
+
+    except Exception as e:
+        logger.error("Error in generate_story stream: %s", e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
+
+@app.post('/tools/analyze_story_sentiment')
+async def analyze_sentiment_endpoint(data: AnalyzeSentimentRequest):
     """Analyze story sentiment"""
     try:
-        data = request.json
         logger.info("Processing sentiment analysis request")
-        
-        if not data or 'story_content' not in data:
-            return jsonify({'error': 'story_content is required'}), 400
-        
-        result = run_async(
-            story_analyzer.analyze_story_sentiment(
-                data['story_content']
-            )
-        )
-        
+
+        result = await story_analyzer.analyze_story_sentiment(data.story_content)
+
         logger.info("Sentiment analysis completed successfully")
-        return jsonify({'result': result})
-        
+        return {'result': result}
+
     except Exception as e:
-        logger.error(f"Error in analyze_sentiment: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error in analyze_sentiment: %s", e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
 
-@app.route('/tools/generate_story_title', methods=['POST'])
-def generate_title_endpoint():
+@app.post('/tools/generate_story_title')
+async def generate_title_endpoint(data: GenerateTitleRequest):
     """Generate story titles"""
     try:
-        data = request.json
         logger.info("Processing title generation request")
-        
-        if not data or 'story_content' not in data:
-            return jsonify({'error': 'story_content is required'}), 400
-        
-        result = run_async(
-            story_analyzer.generate_story_title(
-                data['story_content'],
-                data.get('sentiment_data', {})
-            )
-        )
-        
+
+        result = await story_analyzer.generate_story_title(data.story_content, data.sentiment_data)
+
         logger.info("Title generation completed successfully")
-        return jsonify({'result': result})
-        
+        return {'result': result}
+
     except Exception as e:
-        logger.error(f"Error in generate_title: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error in generate_title: %s", e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
 
 # ==================================================================================
 # COMPLETE WORKFLOW ENDPOINTS (NEW - combines AI + Database)
 # ==================================================================================
 
-@app.route('/memoir/create_entry', methods=['POST'])
-def create_memoir_entry():
+class MemoirPipelineError(Exception):
+    """A model stage failed in a way that leaves nothing worth saving"""
+
+def memoir_response(entry_id: str, title: str, story_content: str, sentiment_analysis: dict,
+                    images: list, tone: str, created_at: str, word_count: int) -> dict:
+    """Response body shared by fresh and deduplicated memoir entries"""
+    return {
+        'success': True,
+        'entry_id': entry_id,
+        'title': title,
+        'story_content': story_content,
+        'sentiment_analysis': sentiment_analysis,
+        'images': images,
+        'metadata': {
+            'word_count': word_count,
+            'tone': tone,
+            'created_at': created_at
+        }
+    }
+
+async def _build_memoir(images: List[ImageInput], image_bytes: List[bytes], user_context: str, tone: str) -> dict:
+    """
+    Run the model stages: captions, then the story, then sentiment and title together.
+    Raises MemoirPipelineError if captioning or story generation fails;
+    sentiment and title fall back to defaults instead.
+    """
+    # Step 1: Caption one image per group of near-duplicates (burst shots), in one batch call
+    hashes = await asyncio.to_thread(lambda: [dhash(raw) for raw in image_bytes])
+    groups = group_near_duplicates(hashes)
+    representatives = sorted(set(groups))
+
+    logger.info("Captioning %s images (%s distinct)...", len(images), len(representatives))
+    unique_captions = await image_captioner.batch_caption_images([
+        (images[i].image_data, images[i].image_format, image_bytes[i])
+        for i in representatives
+    ])
+    caption_by_image = dict(zip(representatives, unique_captions))
+    results = [caption_by_image[group] for group in groups]
+
+    captions = []
+    image_metadata = []
+
+    for i, caption in enumerate(results):
+        # Check if captioning was successful
+        if not caption or caption.startswith('Error:'):
+            logger.error("Failed to caption image %s: %s", i + 1, caption)
+            raise MemoirPipelineError(f'Failed to caption image {i+1}: {caption}')
+
+        captions.append(caption)
+
+        # Store image metadata
+        image_metadata.append({
+            'image_id': f'img_{i+1}',
+            'caption': caption,
+            'upload_order': i + 1,
+            'image_url': f'placeholder://image_{i+1}.jpg'  # Replace with S3 URL
+        })
+
+    # Validate we have captions
+    if not captions:
+        logger.error("No captions were generated")
+        raise MemoirPipelineError('Failed to generate any image captions')
+
+    logger.info("Generated %s captions successfully", len(captions))
+
+    # Step 2: Generate story from captions
+    logger.info("Generating story from captions...")
+    try:
+        story_content = await story_generator.generate_story(captions, user_context, tone)
+    except Exception as story_error:
+        logger.error("Error generating story: %s", story_error)
+        raise MemoirPipelineError(f'Error generating story: {str(story_error)}') from story_error
+
+    # Check if story generation was successful
+    if not story_content or story_content.startswith('Error:'):
+        logger.error("Failed to generate story: %s", story_content)
+        raise MemoirPipelineError(f'Failed to generate story: {story_content}')
+
+    logger.info("Story generated successfully")
+
+    # Steps 3 & 4: Analyze sentiment and generate title concurrently.
+    # Both only need the story, so the title no longer waits on the sentiment round trip.
+    logger.info("Analyzing story sentiment and generating title...")
+    sentiment_analysis, title = await asyncio.gather(
+        sentiment_breaker.call(
+            story_analyzer.analyze_story_sentiment, story_content,
+            is_failure=lambda result: isinstance(result, dict) and 'error' in result
+        ),
+        title_breaker.call(
+            story_analyzer.generate_story_title, story_content,
+            is_failure=lambda result: not result or isinstance(result, dict)
+        ),
+        return_exceptions=True
+    )
+
+    if isinstance(sentiment_analysis, CircuitOpenError):
+        logger.warning("Sentiment circuit open, using default sentiment")
+        sentiment_analysis = dict(DEFAULT_SENTIMENT)
+    elif isinstance(sentiment_analysis, Exception):
+        logger.error("Error in sentiment analysis: %s", sentiment_analysis)
+        # Use default sentiment
+        sentiment_analysis = dict(DEFAULT_SENTIMENT)
+    elif isinstance(sentiment_analysis, dict) and 'error' in sentiment_analysis:
+        logger.warning("Sentiment analysis failed: %s", sentiment_analysis['error'])
+        # Use default sentiment if analysis fails
+        sentiment_analysis = dict(DEFAULT_SENTIMENT)
+    else:
+        logger.info("Sentiment analysis completed")
+
+    if isinstance(title, CircuitOpenError):
+        logger.warning("Title circuit open, using default title")
+        title = f"My {tone.capitalize()} Memory"
+    elif isinstance(title, Exception):
+        logger.error("Error generating title: %s", title)
+        title = f"My {tone.capitalize()} Memory"
+    elif not title or (isinstance(title, dict) and 'error' in title):
+        logger.warning("Title generation failed, using default")
+        title = f"My {tone.capitalize()} Memory"
+    else:
+        logger.info("Title generated successfully")
+
+    return {
+        'title': title,
+        'story_content': story_content,
+        'sentiment_analysis': sentiment_analysis,
+        'images': image_metadata
+    }
+
+async def _create_memoir(user_id: str, images: List[ImageInput], image_bytes: List[bytes],
+                         user_context: str, tone: str):
+    """Dedupe, run the model pipeline and save; shared by the JSON and multipart endpoints"""
+    # A retried upload of the same memoir is answered from the saved entry, skipping every model call
+    content_hash = content_key(*image_bytes, user_context, tone)
+    existing_entry = await db_service.get_entry_by_hash(user_id, content_hash)
+    if existing_entry:
+        logger.info("Duplicate memoir submission, returning entry %s", existing_entry['entry_id'])
+        return memoir_response(
+            existing_entry['entry_id'],
+            existing_entry.get('title', ''),
+            existing_entry.get('story_content', ''),
+            existing_entry.get('sentiment_analysis', {}),
+            existing_entry.get('images', []),
+            existing_entry.get('tone', tone),
+            existing_entry.get('created_at', 'unknown'),
+            int(existing_entry.get('word_count', 0))
+        )
+
+    try:
+        memoir = await _build_memoir(images, image_bytes, user_context, tone)
+    except MemoirPipelineError as pipeline_error:
+        return ORJSONResponse({'error': str(pipeline_error)}, status_code=500)
+
+    # Counted once here and shared by the saved item and the response
+    word_count = count_words(memoir['story_content'])
+
+    # Step 5: Save to database
+    logger.info("Saving entry to database...")
+    try:
+        entry_id, created_at = await db_service.save_journal_entry(
+            user_id=user_id,
+            user_context=user_context,
+            tone=tone,
+            content_hash=content_hash,
+            word_count=word_count,
+            **memoir
+        )
+
+        logger.info("Entry saved successfully with ID: %s", entry_id)
+
+    except Exception as db_error:
+        logger.error("Error saving to database: %s", db_error)
+        return ORJSONResponse({'error': f'Error saving to database: {str(db_error)}'}, status_code=500)
+
+    logger.info("Memoir entry created successfully: %s", entry_id)
+    return memoir_response(entry_id, tone=tone, created_at=created_at, word_count=word_count, **memoir)
+
+@app.post('/memoir/create_entry')
+async def create_memoir_entry(data: MemoirCreateRequest):
     """
     Complete workflow: Images → Captions → Story → Analysis → Save to DB
     This is the main endpoint your iOS app will use
     """
     try:
-        data = request.json
         logger.info("Processing complete memoir entry creation")
-        
-        # Validate required fields
-        if not data or 'user_id' not in data:
-            logger.error("Missing user_id in request")
-            return jsonify({'error': 'user_id is required'}), 400
-        
-        if 'images' not in data or not data['images']:
+
+        if not data.images:
             logger.error("Missing images in request")
-            return jsonify({'error': 'At least one image is required'}), 400
-        
-        user_id = data['user_id']
-        images = data['images']  # Array of {image_data, image_format}
-        user_context = data.get('user_context', '')
-        tone = data.get('tone', 'heartwarming')
-        
-        logger.info(f"Creating memoir for user {user_id} with {len(images)} images")
-        
-        # Step 1: Caption all images
-        logger.info(f"Captioning {len(images)} images...")
-        captions = []
-        image_metadata = []
-        
+            return ORJSONResponse({'error': 'At least one image is required'}, status_code=400)
+
+        user_id = data.user_id
+        images = data.images
+        user_context = data.user_context
+        tone = data.tone
+
+        logger.info("Creating memoir for user %s with %s images", user_id, len(images))
+
+        # Validate image data before starting any upstream calls
+        for i, img in enumerate(images):
+            if not img.image_data:
+                logger.error("Image %s missing image_data", i + 1)
+                return ORJSONResponse({'error': f'Image {i+1} missing image_data'}, status_code=400)
+
+        # Decode each image exactly once; the bytes are reused by the caption step
+        image_bytes = []
         for i, img in enumerate(images):
             try:
-                logger.info(f"Processing image {i+1}/{len(images)}")
-                
-                # Validate image data
-                if 'image_data' not in img or not img['image_data']:
-                    logger.error(f"Image {i+1} missing image_data")
-                    return jsonify({'error': f'Image {i+1} missing image_data'}), 400
-                
-                # Caption the image
-                caption = run_async(
-                    image_captioner.caption_image(
-                        img['image_data'],
-                        img.get('image_format', 'jpeg')
-                    )
-                )
-                
-                # Check if captioning was successful
-                if not caption or caption.startswith('Error:'):
-                    logger.error(f"Failed to caption image {i+1}: {caption}")
-                    return jsonify({'error': f'Failed to caption image {i+1}: {caption}'}), 500
-                
-                captions.append(caption)
-                logger.info(f"Successfully captioned image {i+1}")
-                
-                # Store image metadata
-                image_metadata.append({
-                    'image_id': f'img_{i+1}',
-                    'caption': caption,
-                    'upload_order': i + 1,
-                    'image_url': f'placeholder://image_{i+1}.jpg'  # Replace with S3 URL
-                })
-                
-            except Exception as img_error:
-                logger.error(f"Error processing image {i+1}: {str(img_error)}")
-                return jsonify({'error': f'Error processing image {i+1}: {str(img_error)}'}), 500
-        
-        # Validate we have captions
-        if not captions:
-            logger.error("No captions were generated")
-            return jsonify({'error': 'Failed to generate any image captions'}), 500
-        
-        logger.info(f"Generated {len(captions)} captions successfully")
-        
-        # Step 2: Generate story from captions
-        logger.info("Generating story from captions...")
-        try:
-            story_content = run_async(
-                story_generator.generate_story(captions, user_context, tone)
-            )
-            
-            # Check if story generation was successful
-            if not story_content or story_content.startswith('Error:'):
-                logger.error(f"Failed to generate story: {story_content}")
-                return jsonify({'error': f'Failed to generate story: {story_content}'}), 500
-            
-            logger.info("Story generated successfully")
-            
-        except Exception as story_error:
-            logger.error(f"Error generating story: {str(story_error)}")
-            return jsonify({'error': f'Error generating story: {str(story_error)}'}), 500
-        
-        # Step 3: Analyze sentiment
-        logger.info("Analyzing story sentiment...")
-        try:
-            sentiment_analysis = run_async(
-                story_analyzer.analyze_story_sentiment(story_content)
-            )
-            
-            # Check for errors in sentiment analysis
-            if isinstance(sentiment_analysis, dict) and 'error' in sentiment_analysis:
-                logger.warning(f"Sentiment analysis failed: {sentiment_analysis['error']}")
-                # Use default sentiment if analysis fails
-                sentiment_analysis = {
-                    'primary_mood': 'neutral',
-                    'emotional_intensity': 5,
-                    'overall_sentiment': 'neutral'
-                }
-            
-            logger.info("Sentiment analysis completed")
-            
-        except Exception as sentiment_error:
-            logger.error(f"Error in sentiment analysis: {str(sentiment_error)}")
-            # Use default sentiment
-            sentiment_analysis = {
-                'primary_mood': 'neutral',
-                'emotional_intensity': 5,
-                'overall_sentiment': 'neutral'
-            }
-        
-        # Step 4: Generate title
-        logger.info("Generating story title...")
-        try:
-            title = run_async(
-                story_analyzer.generate_story_title(story_content, sentiment_analysis)
-            )
-            
-            # Check if title generation was successful
-            if not title or (isinstance(title, dict) and 'error' in title):
-                logger.warning(f"Title generation failed, using default")
-                title = f"My {tone.capitalize()} Memory"
-            
-            logger.info("Title generated successfully")
-            
-        except Exception as title_error:
-            logger.error(f"Error generating title: {str(title_error)}")
-            title = f"My {tone.capitalize()} Memory"
-        
-        # Step 5: Save to database
-        logger.info("Saving entry to database...")
-        try:
-            entry_id = db_service.save_journal_entry(
-                user_id=user_id,
-                title=title,
-                story_content=story_content,
-                user_context=user_context,
-                tone=tone,
-                images=image_metadata,
-                sentiment_analysis=sentiment_analysis
-            )
-            
-            logger.info(f"Entry saved successfully with ID: {entry_id}")
-            
-        except Exception as db_error:
-            logger.error(f"Error saving to database: {str(db_error)}")
-            return jsonify({'error': f'Error saving to database: {str(db_error)}'}), 500
-        
-        # Prepare response
-        response = {
-            'success': True,
-            'entry_id': entry_id,
-            'title': title,
-            'story_content': story_content,
-            'sentiment_analysis': sentiment_analysis,
-            'images': image_metadata,
-            'metadata': {
-                'word_count': len(story_content.split()),
-                'tone': tone,
-                'created_at': entry_id.split('_')[1] if '_' in entry_id else 'unknown'
-            }
-        }
-        
-        logger.info(f"Memoir entry created successfully: {entry_id}")
-        return jsonify(response)
-        
+                image_bytes.append(decode_image_data(img.image_data))
+            except ValueError:
+                logger.error("Image %s has invalid base64 image_data", i + 1)
+                return ORJSONResponse({'error': f'Image {i+1} has invalid base64 image_data'}, status_code=400)
+
+        return await _create_memoir(user_id, images, image_bytes, user_context, tone)
+
     except Exception as e:
-        logger.error(f"Unexpected error creating memoir entry: {str(e)}")
+        logger.error("Unexpected error creating memoir entry: %s", e)
         import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
-        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+        logger.error("Traceback: %s", traceback.format_exc())
+        return ORJSONResponse({'error': f'Unexpected error: {str(e)}'}, status_code=500)
+
+def multipart_image_format(content_type: Optional[str]) -> Optional[str]:
+    """
+    The ImageFormat for an uploaded part's content type, or None if it isn't a supported image.
+    Parts sent without a content type are taken as JPEG, the JSON path's default.
+    """
+    if not content_type:
+        return 'jpeg'
+    kind, _, subtype = content_type.partition(';')[0].strip().lower().partition('/')
+    if subtype == 'jpg':
+        subtype = 'jpeg'
+    if kind != 'image' or subtype not in get_args(ImageFormat):
+        return None
+    return subtype
+
+@app.post('/memoir/create_entry_multipart')
+async def create_memoir_entry_multipart(
+    user_id: str = Form(...),
+    images: List[UploadFile] = File(...),
+    user_context: str = Form(''),
+    tone: Tone = Form('heartwarming')
+):
+    """
+    Same workflow as /memoir/create_entry, with images uploaded as raw multipart files
+    instead of base64 inside JSON: a quarter fewer bytes on the wire and no JSON parse of the image data
+    """
+    try:
+        logger.info("Processing multipart memoir entry creation for user %s with %s images", user_id, len(images))
+
+        image_bytes = []
+        image_inputs = []
+        for i, upload in enumerate(images):
+            raw = await upload.read()
+            if not raw:
+                logger.error("Image %s is empty", i + 1)
+                return ORJSONResponse({'error': f'Image {i+1} is empty'}, status_code=400)
+
+            image_format = multipart_image_format(upload.content_type)
+            if image_format is None:
+                logger.error("Image %s has unsupported content type %s", i + 1, upload.content_type)
+                return ORJSONResponse({
+                    'error': f'Image {i+1} has unsupported content type {upload.content_type}',
+                    'supported_formats': list(get_args(ImageFormat))
+                }, status_code=400)
+
+            # The vision API only takes data URLs, so encode exactly once, on the way out
+            image_bytes.append(raw)
+            image_inputs.append(ImageInput(image_data=encode_image_data(raw), image_format=image_format))
+
+        return await _create_memoir(user_id, image_inputs, image_bytes, user_context, tone)
+
+    except Exception as e:
+        logger.error("Unexpected error creating memoir entry: %s", e)
+        return ORJSONResponse({'error': f'Unexpected error: {str(e)}'}, status_code=500)
 
 # ==================================================================================
 # USER MANAGEMENT ENDPOINTS
 # ==================================================================================
 
-@app.route('/users', methods=['POST'])
-def create_user():
+@app.post('/users')
+async def create_user(data: CreateUserRequest):
     """Create a new user"""
     try:
-        data = request.json
-        
-        if not data or 'email' not in data:
-            return jsonify({'error': 'email is required'}), 400
-        
         # Check if user already exists
-        existing_user = db_service.get_user_by_email(data['email'])
+        existing_user = await db_service.get_user_by_email(data.email)
         if existing_user:
-            return jsonify({'error': 'User with this email already exists'}), 409
-        
-        user_id = db_service.create_user(
-            email=data['email'],
-            preferences=data.get('preferences', {})
+            return ORJSONResponse({'error': 'User with this email already exists'}, status_code=409)
+
+        user_id = await db_service.create_user(
+            email=data.email,
+            preferences=data.preferences
         )
-        
-        return jsonify({'user_id': user_id, 'email': data['email']})
-        
+
+        return {'user_id': user_id, 'email': data.email}
+
     except Exception as e:
-        logger.error(f"Error creating user: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error creating user: %s", e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
 
-@app.route('/users/<user_id>', methods=['GET'])
-def get_user(user_id):
+@app.get('/users/{user_id}')
+async def get_user(user_id: str):
     """Get user profile"""
     try:
-        user = db_service.get_user(user_id)
+        user = await db_service.get_user(user_id)
         if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        return jsonify(user)
-        
+            return ORJSONResponse({'error': 'User not found'}, status_code=404)
+
+        # Never send the password hash to clients
+        return {k: v for k, v in user.items() if k != 'password_hash'}
+
     except Exception as e:
-        logger.error(f"Error getting user: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error getting user: %s", e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
 
-@app.route('/users/<user_id>/stats', methods=['GET'])
-def get_user_stats(user_id):
+@app.get('/users/{user_id}/stats')
+async def get_user_stats(user_id: str):
     """Get user statistics and insights"""
     try:
-        stats = db_service.get_user_stats(user_id)
-        return jsonify(stats)
-        
+        stats = await db_service.get_user_stats(user_id)
+        return stats
+
     except Exception as e:
-        logger.error(f"Error getting user stats: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error getting user stats: %s", e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
 
 # ==================================================================================
 # JOURNAL ENTRY MANAGEMENT
 # ==================================================================================
+# Static routes (favorites, mood) must be registered before /entries/{entry_id},
+# since routes are matched in declaration order.
 
-@app.route('/users/<user_id>/entries', methods=['GET'])
-def get_user_entries(user_id):
-    """Get user's journal entries"""
-    try:
-        limit = int(request.args.get('limit', 20))
-        newest_first = request.args.get('newest_first', 'true').lower() == 'true'
-        
-        entries = db_service.get_user_entries(user_id, limit, newest_first)
-        return jsonify({'entries': entries, 'count': len(entries)})
-        
-    except Exception as e:
-        logger.error(f"Error getting user entries: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+def orjson_default(obj):
+    """Encode DynamoDB numbers the way FastAPI's jsonable_encoder does for regular responses"""
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    raise TypeError
 
-@app.route('/users/<user_id>/entries/<entry_id>', methods=['GET'])
-def get_entry_by_id(user_id, entry_id):
-    """Get specific journal entry with better error handling"""
+async def stream_entries(first_page, pages):
+    """Encode entries page by page as {"entries": [...], "count": n} without holding the whole list"""
+    count = 0
     try:
-        logger.info(f"Getting entry {entry_id} for user {user_id}")
-        
-        entry = db_service.get_entry_by_id(user_id, entry_id)
-        if not entry:
-            logger.warning(f"Entry {entry_id} not found for user {user_id}")
-            return jsonify({'error': 'Entry not found'}), 404
-        
-        logger.info(f"Successfully retrieved entry {entry_id}")
-        return jsonify(entry)
-        
+        yield b'{"entries":['
+        page = first_page
+        while page is not None:
+            for entry in page:
+                yield (b',' if count else b'') + orjson.dumps(entry, default=orjson_default)
+                count += 1
+            page = await anext(pages, None)
+        yield b'],"count":%d}' % count
     except Exception as e:
-        logger.error(f"Error getting entry {entry_id}: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        # Too late for an error status; aborting leaves the body unterminated so the client fails to decode it
+        logger.error("Error streaming entries after %s: %s", count, e)
+        raise
+    finally:
+        await pages.aclose()
 
+def requested_fields(request: Request) -> Optional[List[str]]:
+    """
+    Attributes named in ?fields=a,b,c, for list views that don't need the story text.
+    None (every attribute) when absent, since the app decodes full entries by default.
+    """
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()] or None
 
-    """Get entries by mood"""
+@app.get('/users/{user_id}/entries')
+async def get_user_entries(user_id: str, request: Request):
+    """Get user's journal entries, streamed as DynamoDB pages arrive"""
     try:
-        entries = db_service.get_entries_by_mood(user_id, mood)
-        return jsonify({'entries': entries, 'mood': mood, 'count': len(entries)})
-        
+        limit = int(request.query_params.get('limit', 20))
+        newest_first = request.query_params.get('newest_first', 'true').lower() == 'true'
+
+        pages = db_service.iter_user_entries(user_id, limit, newest_first, fields=requested_fields(request))
+        # Fetch the first page before committing to a 200 so failures still get an error response
+        first_page = await anext(pages, [])
+        return StreamingResponse(stream_entries(first_page, pages), media_type='application/json')
+
     except Exception as e:
-        logger.error(f"Error getting entries by mood: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error getting user entries: %s", e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
 
-@app.route('/users/<user_id>/entries/favorites', methods=['GET'])
-def get_favorite_entries(user_id):
+@app.get('/users/{user_id}/entries/favorites')
+async def get_favorite_entries(user_id: str, request: Request):
     """Get user's favorite journal entries only"""
     try:
-        limit = int(request.args.get('limit', 20))
-        newest_first = request.args.get('newest_first', 'true').lower() == 'true'
-        
-        logger.info(f"Getting favorite entries for user {user_id}, limit: {limit}")
-        
-        favorite_entries = db_service.get_favorite_entries(user_id, limit, newest_first)
-        
-        logger.info(f"Retrieved {len(favorite_entries)} favorite entries")
-        
-        return jsonify({
-            'entries': favorite_entries, 
+        limit = int(request.query_params.get('limit', 20))
+        newest_first = request.query_params.get('newest_first', 'true').lower() == 'true'
+
+        logger.info("Getting favorite entries for user %s, limit: %s", user_id, limit)
+
+        favorite_entries = await db_service.get_favorite_entries(user_id, limit, newest_first,
+                                                                fields=requested_fields(request))
+
+        logger.info("Retrieved %s favorite entries", len(favorite_entries))
+
+        return {
+            'entries': favorite_entries,
             'count': len(favorite_entries),
             'user_id': user_id,
             'filter': 'favorites'
-        })
-        
+        }
+
     except ValueError:
-        return jsonify({'error': 'Invalid limit parameter'}), 400
+        return ORJSONResponse({'error': 'Invalid limit parameter'}, status_code=400)
     except Exception as e:
-        logger.error(f"Error getting favorite entries: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error getting favorite entries: %s", e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
 
-@app.route('/users/<user_id>/entries/mood/<mood>', methods=['GET'])
-def get_entries_by_mood(user_id, mood):
+@app.get('/users/{user_id}/entries/mood/{mood}')
+async def get_entries_by_mood(user_id: str, mood: str, request: Request):
     """Get entries filtered by specific mood"""
     try:
-        limit = int(request.args.get('limit', 20))
-        
+        limit = int(request.query_params.get('limit', 20))
+
         # Validate mood parameter
         valid_moods = ['joyful', 'nostalgic', 'adventurous', 'peaceful', 'melancholic', 'excited', 'grateful', 'reflective', 'neutral']
         if mood not in valid_moods:
-            return jsonify({
-                'error': 'Invalid mood', 
+            return ORJSONResponse({
+                'error': 'Invalid mood',
                 'valid_moods': valid_moods
-            }), 400
-        
-        logger.info(f"Getting entries with mood '{mood}' for user {user_id}")
-        
-        mood_entries = db_service.get_entries_by_mood(user_id, mood, limit)
-        
-        logger.info(f"Retrieved {len(mood_entries)} entries with mood '{mood}'")
-        
-        return jsonify({
+            }, status_code=400)
+
+        logger.info("Getting entries with mood '%s' for user %s", mood, user_id)
+
+        mood_entries = await db_service.get_entries_by_mood(user_id, mood, limit, fields=requested_fields(request))
+
+        logger.info("Retrieved %s entries with mood '%s'", len(mood_entries), mood)
+
+        return {
             'entries': mood_entries,
-            'count': len(mood_entries), 
+            'count': len(mood_entries),
             'user_id': user_id,
             'mood': mood,
             'filter': f'mood:{mood}'
-        })
-        
+        }
+
     except ValueError:
-        return jsonify({'error': 'Invalid limit parameter'}), 400
+        return ORJSONResponse({'error': 'Invalid limit parameter'}, status_code=400)
     except Exception as e:
-        logger.error(f"Error getting entries by mood: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-    
-@app.route('/users/<user_id>/entries/<entry_id>/favorite', methods=['PATCH'])
-def toggle_favorite(user_id, entry_id):
+        logger.error("Error getting entries by mood: %s", e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
+
+@app.get('/users/{user_id}/entries/{entry_id}')
+async def get_entry_by_id(user_id: str, entry_id: str):
+    """Get specific journal entry with better error handling"""
+    try:
+        logger.info("Getting entry %s for user %s", entry_id, user_id)
+
+        entry = await db_service.get_entry_by_id(user_id, entry_id)
+        if not entry:
+            logger.warning("Entry %s not found for user %s", entry_id, user_id)
+            return ORJSONResponse({'error': 'Entry not found'}, status_code=404)
+
+        logger.info("Successfully retrieved entry %s", entry_id)
+        return entry
+
+    except Exception as e:
+        logger.error("Error getting entry %s: %s", entry_id, e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
+
+@app.patch('/users/{user_id}/entries/{entry_id}/favorite')
+async def toggle_favorite(user_id: str, entry_id: str, data: FavoriteUpdateRequest):
     """Toggle entry favorite status with validation"""
     try:
-        data = request.json
-        if not data or 'is_favorite' not in data:
-            return jsonify({'error': 'is_favorite is required'}), 400
-        
-        is_favorite = data.get('is_favorite')
-        if not isinstance(is_favorite, bool):
-            return jsonify({'error': 'is_favorite must be true or false'}), 400
-        
-        logger.info(f"Toggling favorite for entry {entry_id} to {is_favorite}")
-        
+        is_favorite = data.is_favorite
+
+        logger.info("Toggling favorite for entry %s to %s", entry_id, is_favorite)
+
         # Attempt to update favorite status
-        was_updated = db_service.update_entry_favorite(user_id, entry_id, is_favorite)
-        
+        was_updated = await db_service.update_entry_favorite(user_id, entry_id, is_favorite)
+
         if was_updated:
-            logger.info(f"Successfully updated favorite status for entry {entry_id}")
-            return jsonify({
-                'success': True, 
+            logger.info("Successfully updated favorite status for entry %s", entry_id)
+            return {
+                'success': True,
                 'is_favorite': is_favorite,
                 'entry_id': entry_id,
                 'user_id': user_id,
                 'message': f'Entry {"added to" if is_favorite else "removed from"} favorites'
-            })
+            }
         else:
-            logger.warning(f"Entry {entry_id} not found for favorite update")
-            return jsonify({'error': 'Entry not found'}), 404
-        
+            logger.warning("Entry %s not found for favorite update", entry_id)
+            return ORJSONResponse({'error': 'Entry not found'}, status_code=404)
+
     except Exception as e:
-        logger.error(f"Error toggling favorite for entry {entry_id}: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error toggling favorite for entry %s: %s", entry_id, e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
 
-@app.route('/users/<user_id>/entries/<entry_id>', methods=['DELETE'])
-def delete_entry(user_id, entry_id):
+@app.delete('/users/{user_id}/entries/{entry_id}')
+async def delete_entry(user_id: str, entry_id: str):
     """Delete journal entry with proper validation"""
     try:
-        logger.info(f"Deleting entry {entry_id} for user {user_id}")
-        
+        logger.info("Deleting entry %s for user %s", entry_id, user_id)
+
         # Attempt to delete the entry
-        was_deleted = db_service.delete_entry(user_id, entry_id)
-        
+        was_deleted = await db_service.delete_entry(user_id, entry_id)
+
         if was_deleted:
-            logger.info(f"Successfully deleted entry {entry_id}")
-            return jsonify({
-                'success': True, 
+            logger.info("Successfully deleted entry %s", entry_id)
+            return {
+                'success': True,
                 'message': 'Entry deleted successfully',
                 'entry_id': entry_id,
                 'user_id': user_id
-            })
+            }
         else:
-            logger.warning(f"Entry {entry_id} not found for deletion")
-            return jsonify({'error': 'Entry not found'}), 404
-        
+            logger.warning("Entry %s not found for deletion", entry_id)
+            return ORJSONResponse({'error': 'Entry not found'}, status_code=404)
+
     except Exception as e:
-        logger.error(f"Error deleting entry {entry_id}: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error deleting entry %s: %s", entry_id, e)
+        return ORJSONResponse({'error': str(e)}, status_code=500)
 
-@app.route('/auth/register', methods=['POST'])
-def register_user():
+@app.post('/auth/register')
+async def register_user(data: RegisterRequest):
     """Register a new user with email and password"""
     try:
-        data = request.json
         logger.info("Processing user registration")
-        
-        if not data or 'email' not in data or 'password' not in data:
-            return jsonify({'error': 'email and password are required'}), 400
-        
-        email = data['email'].strip().lower()
-        password = data['password']
-        
+
+        email = data.email.strip().lower()
+        password = data.password
+
         # Basic validation
         if len(password) < 6:
-            return jsonify({'error': 'Password must be at least 6 characters'}), 400
-        
+            return ORJSONResponse({'error': 'Password must be at least 6 characters'}, status_code=400)
+
         if '@' not in email or '.' not in email:
-            return jsonify({'error': 'Please enter a valid email address'}), 400
-        
+            return ORJSONResponse({'error': 'Please enter a valid email address'}, status_code=400)
+
         try:
-            user_id = db_service.create_user_with_password(
+            user_id = await db_service.create_user_with_password(
                 email=email,
                 password=password,
-                preferences=data.get('preferences', {})
+                preferences=data.preferences
             )
-            
-            logger.info(f"User registered successfully: {user_id}")
-            return jsonify({
+
+            logger.info("User registered successfully: %s", user_id)
+            return {
                 'success': True,
                 'user_id': user_id,
                 'email': email,
                 'message': 'Account created successfully'
-            })
-            
+            }
+
         except ValueError as e:
-            logger.warning(f"Registration failed: {str(e)}")
-            return jsonify({'error': str(e)}), 409
-        
+            logger.warning("Registration failed: %s", e)
+            return ORJSONResponse({'error': str(e)}, status_code=409)
+
     except Exception as e:
-        logger.error(f"Error in user registration: {str(e)}")
-        return jsonify({'error': 'Registration failed'}), 500
+        logger.error("Error in user registration: %s", e)
+        return ORJSONResponse({'error': 'Registration failed'}, status_code=500)
 
-@app.route('/auth/login', methods=['POST'])
-def login_user():
+@app.post('/auth/login')
+async def login_user(data: LoginRequest):
     """Authenticate user with email and password"""
     try:
-        data = request.json
         logger.info("Processing user login")
-        
-        if not data or 'email' not in data or 'password' not in data:
-            return jsonify({'error': 'email and password are required'}), 400
-        
-        email = data['email'].strip().lower()
-        password = data['password']
-        
-        user = db_service.authenticate_user(email, password)
-        
+
+        email = data.email.strip().lower()
+        password = data.password
+
+        user = await db_service.authenticate_user(email, password)
+
         if user:
-            logger.info(f"User authenticated successfully: {user['user_id']}")
-            
+            logger.info("User authenticated successfully: %s", user['user_id'])
+
             # Remove password hash from response
             user_response = {k: v for k, v in user.items() if k != 'password_hash'}
-            
-            return jsonify({
+
+            return {
                 'success': True,
                 'user': user_response,
                 'message': 'Login successful'
-            })
+            }
         else:
-            logger.warning(f"Authentication failed for email: {email}")
-            return jsonify({'error': 'Invalid email or password'}), 401
-        
+            logger.warning("Authentication failed for email: %s", email)
+            return ORJSONResponse({'error': 'Invalid email or password'}, status_code=401)
+
     except Exception as e:
-        logger.error(f"Error in user login: {str(e)}")
-        return jsonify({'error': 'Login failed'}), 500
+        logger.error("Error in user login: %s", e)
+        return ORJSONResponse({'error': 'Login failed'}, status_code=500)
 
-@app.route('/auth/change-password', methods=['POST'])
-def change_password():
+@app.post('/auth/change-password')
+async def change_password(data: ChangePasswordRequest):
     """Change user password"""
     try:
-        data = request.json
-        
-        if not data or 'user_id' not in data or 'current_password' not in data or 'new_password' not in data:
-            return jsonify({'error': 'user_id, current_password, and new_password are required'}), 400
-        
-        user_id = data['user_id']
-        current_password = data['current_password']
-        new_password = data['new_password']
-        
+        user_id = data.user_id
+        current_password = data.current_password
+        new_password = data.new_password
+
         if len(new_password) < 6:
-            return jsonify({'error': 'New password must be at least 6 characters'}), 400
-        
+            return ORJSONResponse({'error': 'New password must be at least 6 characters'}, status_code=400)
+
         # Get user and verify current password
-        user = db_service.get_user(user_id)
+        user = await db_service.get_user(user_id)
         if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
+            return ORJSONResponse({'error': 'User not found'}, status_code=404)
+
         # Verify current password
-        stored_hash = user.get('password_hash', '')
-        if not bcrypt.checkpw(current_password.encode('utf-8'), stored_hash.encode('utf-8')):
-            return jsonify({'error': 'Current password is incorrect'}), 401
-        
+        if not await db_service.verify_password(user, current_password):
+            return ORJSONResponse({'error': 'Current password is incorrect'}, status_code=401)
+
         # Update password
-        success = db_service.update_user_password(user_id, new_password)
-        
+        success = await db_service.update_user_password(user_id, new_password)
+
         if success:
-            return jsonify({'success': True, 'message': 'Password updated successfully'})
+            return {'success': True, 'message': 'Password updated successfully'}
         else:
-            return jsonify({'error': 'Failed to update password'}), 500
-        
+            return ORJSONResponse({'error': 'Failed to update password'}, status_code=500)
+
     except Exception as e:
-        logger.error(f"Error changing password: {str(e)}")
-        return jsonify({'error': 'Password change failed'}), 500
+        logger.error("Error changing password: %s", e)
+        return ORJSONResponse({'error': 'Password change failed'}, status_code=500)
 # ==================================================================================
 # ERROR HANDLERS
 # ==================================================================================
 
-@app.errorhandler(404)
-def not_found(error):
-    return jsonify({'error': 'Endpoint not found'}), 404
+@app.exception_handler(StarletteHTTPException)
+async def http_error(request: Request, exc: StarletteHTTPException):
+    if exc.status_code == 404:
+        return ORJSONResponse({'error': 'Endpoint not found'}, status_code=404)
+    return ORJSONResponse({'error': exc.detail}, status_code=exc.status_code)
+
+@app.exception_handler(RequestValidationError)
+async def bad_request(request: Request, exc: RequestValidationError):
+    # Report the first failing field in the same {'error': ...} shape as the handlers' own 400s
+    for error in exc.errors():
+        field = '.'.join(str(part) for part in error['loc'][1:])
+        if not field or error['type'] == 'json_invalid':
+            break
+        if error['type'] == 'missing':
+            return ORJSONResponse({'error': f'{field} is required'}, status_code=400)
+        return ORJSONResponse({'error': f'Invalid {field}: {error["msg"]}'}, status_code=400)
+    return ORJSONResponse({'error': 'Invalid request'}, status_code=400)
 
-@app.errorhandler(500)
-def internal_error(error):
-    return jsonify({'error': 'Internal server error'}), 500
+@app.exception_handler(Exception)
+async def internal_error(request: Request, exc: Exception):
+    return ORJSONResponse({'error': 'Internal server error'}, status_code=500)
 
+# Local development only; production runs under gunicorn (see gunicorn.conf.py)
 if __name__ == '__main__':
     logger.info("Starting MemoirAI HTTP Server with DynamoDB integration...")
-    app.run(host='0.0.0.0', port=8000, debug=False)
\ No newline at end of file
+    # uvloop's libuv-based loop is markedly cheaper per await than the default selector loop,
+    # and httptools' C parser is faster than h11; keep client connections open between requests
+    uvicorn.run(app, host='0.0.0.0', port=8000, loop='uvloop', http='httptools', timeout_keep_alive=75)
@@ -1,17 +1,82 @@
 import asyncio
+import functools
 from mcp.server import Server
 from mcp.types import Tool, TextContent
-import json
-from tools.image_captioning import ImageCaptioningTool
-from tools.story_generation import StoryGenerationTool
-from tools.story_analysis import StoryAnalysisTool
+import orjson
+
+# Tool definitions never change, so they are built once at import instead of per list_tools call
+_TOOLS = [
+    Tool(
+        name = "caption_image",
+        description = "Analyze an image and provide a detailed caption",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "image_data": {"type": "string", "description": "Base64 encoded image"},
+                "image_format": {"type": "string", "description": "Image format(jpg, png, etc.)"}
+            },
+            "required": ["image_data"]
+        }
+    ),
+    Tool (
+        name = "generate_story",
+        description = "Create a cohesive story from image captions and context",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "captions": {"type": "array", "items": {"type": "string"}},
+                "user_context": {"type": "string"},
+                "tone": {"type": "string", "enum": ["whimsical", "nostalgic", "adventurous", "heartwarming"]}
+            },
+            "required": ["captions"]
+        }
+    ),
+
+    Tool(
+        name="analyze_story_sentiment",
+        description="Analyze the emotional tone, themes, and mood of a journal entry",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "story_content": {"type": "string", "description": "The journal entry text to analyze"}
+            },
+            "required": ["story_content"]
+        }
+    ),
+    Tool(
+        name="generate_story_title",
+        description="Create compelling, personalized titles for journal entries",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "story_content": {"type": "string", "description": "The journal entry content"},
+                "sentiment_data": {"type": "object", "description": "Optional sentiment analysis data for context"}
+            },
+            "required": ["story_content"]
+        }
+    )
+]
+
+# Tool modules pull in the OpenAI SDK and httpx, so each one is imported
+# and constructed on its first call rather than at server start-up
+@functools.cache
+def _get_captioner():
+    from tools.image_captioning import ImageCaptioningTool
+    return ImageCaptioningTool()
+
+@functools.cache
+def _get_story_generator():
+    from tools.story_generation import StoryGenerationTool
+    return StoryGenerationTool()
+
+@functools.cache
+def _get_story_analysis():
+    from tools.story_analysis import StoryAnalysisTool
+    return StoryAnalysisTool()
 
 class MemoirAIServer:
     def __init__(self):
         self.server = Server("memoirai-storyteller")
-        self.image_captioner = ImageCaptioningTool()
-        self.story_generator = StoryGenerationTool()
-        self.story_analysis = StoryAnalysisTool()
 
         self._register_handlers()
 
@@ -25,70 +90,20 @@ class MemoirAIServer:
 
     async def list_tools(self):
         """Define available tools for the LLM"""
-        return [
-            Tool(
-                name = "caption_image",
-                description = "Analyze an image and provide a detailed caption",
-                inputSchema={
-                    "type": "object",
-                    "properties": {
-                        "image_data": {"type": "string", "description": "Base64 encoded image"},
-                        "image_format": {"type": "string", "description": "Image format(jpg, png, etc.)"}
-                    },
-                    "required": ["image_data"]
-                }
-            ),
-            Tool (
-                name = "generate_story",
-                description = "Create a cohesive story from image captions and context",
-                inputSchema={
-                    "type": "object",
-                    "properties": {
-                        "captions": {"type": "array", "items": {"type": "string"}},
-                        "user_context": {"type": "string"},
-                        "tone": {"type": "string", "enum": ["whimsical", "nostalgic", "adventurous", "heartwarming"]}
-                    },
-                    "required": ["captions"]
-                }
-            ),
-
-            Tool(
-                name="analyze_story_sentiment",
-                description="Analyze the emotional tone, themes, and mood of a journal entry",
-                inputSchema={
-                    "type": "object",
-                    "properties": {
-                        "story_content": {"type": "string", "description": "The journal entry text to analyze"}
-                    },
-                    "required": ["story_content"]
-                }
-            ),
-            Tool(
-                name="generate_story_title",
-                description="Create compelling, personalized titles for journal entries",
-                inputSchema={
-                    "type": "object",
-                    "properties": {
-                        "story_content": {"type": "string", "description": "The journal entry content"},
-                        "sentiment_data": {"type": "object", "description": "Optional sentiment analysis data for context"}
-                    },
-                    "required": ["story_content"]
-                }
-            )
-        ]
+        return _TOOLS
     
     async def call_tool(self, name:str, arguments: dict):
         """Route tools calls to appropriate handlers"""
 
         if name == "caption_image":
-            result = await self.image_captioner.caption_image(
+            result = await _get_captioner().caption_image(
                 arguments["image_data"],
                 arguments.get("image_format", "jpeg")
             )
             return TextContent(type="text", text=result)
         
         elif name == "generate_story":
-            result = await self.story_generator.generate_story(
+            result = await _get_story_generator().generate_story(
                 arguments["captions"],
                 arguments.get("user_context", ""),
                 arguments.get("tone", "heartwarming")
@@ -96,13 +111,14 @@ class MemoirAIServer:
             return TextContent(type="text", text=result)
         
         elif name == "analyze_story_sentiment":
-            result = await self.story_analysis.analyze_story_sentiment(
+            result = await _get_story_analysis().analyze_story_sentiment(
                 arguments["story_content"],
             )
-            return TextContent(type="text", text=json.dumps(result, indent=2))
+            # Compact orjson output: the client parses it, nobody reads the indentation
+            return TextContent(type="text", text=orjson.dumps(result).decode())
         
         elif name == "generate_story_title":
-            result = await self.story_analysis.generate_story_title(
+            result = await _get_story_analysis().generate_story_title(
                 arguments["story_content"],
                 arguments.get("sentiment_data", {}),
             )
@@ -0,0 +1,161 @@
+"""
+DynamoDB table definitions and the one-off migrations that bring existing tables up to them
+
+    python migrations.py create-tables         # fresh environment: both tables with every index
+    python migrations.py create-indexes        # existing tables: add the indexes they're missing
+    python migrations.py backfill-index-keys   # give old entries the new indexes' sort keys
+    python migrations.py backfill-user-totals  # rebuild the running totals on every user
+
+Set DYNAMO_NEW_INDEXES=true on the servers once create-indexes and backfill-index-keys have run.
+"""
+import argparse
+import asyncio
+import logging
+from botocore.exceptions import ClientError
+from tools.database_service import DatabaseService, JOURNAL_TABLE, USERS_TABLE
+from config.logging_config import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Seconds between DescribeTable polls while a table or index is being built
+POLL_INTERVAL = 10
+
+def _index(name: str, hash_key: str, range_key: str = None, projection: str = 'ALL') -> dict:
+    key_schema = [{'AttributeName': hash_key, 'KeyType': 'HASH'}]
+    if range_key:
+        key_schema.append({'AttributeName': range_key, 'KeyType': 'RANGE'})
+    return {'IndexName': name, 'KeySchema': key_schema, 'Projection': {'ProjectionType': projection}}
+
+TABLE_DEFINITIONS = {
+    USERS_TABLE: {
+        'KeySchema': [{'AttributeName': 'user_id', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': {'user_id': 'S', 'email': 'S'},
+        'GlobalSecondaryIndexes': [
+            _index('EmailIndex', 'email')
+        ]
+    },
+    JOURNAL_TABLE: {
+        'KeySchema': [
+            {'AttributeName': 'user_id', 'KeyType': 'HASH'},
+            {'AttributeName': 'entry_id', 'KeyType': 'RANGE'}
+        ],
+        'AttributeDefinitions': {
+            'user_id': 'S', 'entry_id': 'S', 'created_at': 'S', 'created_at_ms': 'N',
+            'primary_mood': 'S', 'mood_created_at': 'S', 'favorite_created_at': 'S', 'content_hash': 'S'
+        },
+        'GlobalSecondaryIndexes': [
+            _index('DateIndex', 'user_id', 'created_at'),
+            _index('MoodIndex', 'user_id', 'primary_mood'),
+            # Added with DYNAMO_NEW_INDEXES
+            _index('DateMsIndex', 'user_id', 'created_at_ms'),
+            _index('MoodDateIndex', 'user_id', 'mood_created_at'),
+            _index('FavoritesIndex', 'user_id', 'favorite_created_at'),
+            # Only used to find the matching entry_id; get_entry_by_hash reads the entry itself
+            _index('ContentHashIndex', 'user_id', 'content_hash', projection='KEYS_ONLY')
+        ]
+    }
+}
+
+def _attribute_definitions(table_name: str, attribute_names) -> list:
+    types = TABLE_DEFINITIONS[table_name]['AttributeDefinitions']
+    return [{'AttributeName': name, 'AttributeType': types[name]} for name in dict.fromkeys(attribute_names)]
+
+def _key_attributes(key_schema: list) -> list:
+    return [key['AttributeName'] for key in key_schema]
+
+async def _wait_until_active(client, table_name: str, index_name: str = None):
+    """Poll until the table (or one of its indexes) has finished building"""
+    while True:
+        table = (await client.describe_table(TableName=table_name))['Table']
+        if index_name is None:
+            status = table['TableStatus']
+        else:
+            status = next(index['IndexStatus'] for index in table.get('GlobalSecondaryIndexes', [])
+                          if index['IndexName'] == index_name)
+        if status == 'ACTIVE':
+            return
+        logger.info("Waiting for %s %s (%s)", table_name, index_name or '', status)
+        await asyncio.sleep(POLL_INTERVAL)
+
+async def create_tables(db_service: DatabaseService):
+    """Create whichever tables don't exist yet, on-demand billing, with all their indexes"""
+    client = db_service.dynamodb.meta.client
+    for table_name, definition in TABLE_DEFINITIONS.items():
+        indexes = definition['GlobalSecondaryIndexes']
+        key_attributes = _key_attributes(definition['KeySchema'])
+        for index in indexes:
+            key_attributes += _key_attributes(index['KeySchema'])
+        try:
+            await client.create_table(
+                TableName=table_name,
+                KeySchema=definition['KeySchema'],
+                AttributeDefinitions=_attribute_definitions(table_name, key_attributes),
+                GlobalSecondaryIndexes=indexes,
+                BillingMode='PAY_PER_REQUEST'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceInUseException':
+                raise
+            logger.info("%s already exists", table_name)
+            continue
+        await _wait_until_active(client, table_name)
+        logger.info("Created %s", table_name)
+
+async def create_indexes(db_service: DatabaseService):
+    """
+    Add the indexes an existing table is missing. DynamoDB builds one new index per
+    UpdateTable call, so each is created and waited on in turn
+    """
+    client = db_service.dynamodb.meta.client
+    for table_name, definition in TABLE_DEFINITIONS.items():
+        table = (await client.describe_table(TableName=table_name))['Table']
+        existing = {index['IndexName'] for index in table.get('GlobalSecondaryIndexes', [])}
+        on_demand = table.get('BillingModeSummary', {}).get('BillingMode') == 'PAY_PER_REQUEST'
+
+        for index in definition['GlobalSecondaryIndexes']:
+            if index['IndexName'] in existing:
+                continue
+            create = dict(index)
+            if not on_demand:
+                # Provisioned tables need capacity on every index; start from the table's own
+                throughput = table['ProvisionedThroughput']
+                create['ProvisionedThroughput'] = {
+                    'ReadCapacityUnits': throughput['ReadCapacityUnits'],
+                    'WriteCapacityUnits': throughput['WriteCapacityUnits']
+                }
+            await client.update_table(
+                TableName=table_name,
+                AttributeDefinitions=_attribute_definitions(table_name, _key_attributes(index['KeySchema'])),
+                GlobalSecondaryIndexUpdates=[{'Create': create}]
+            )
+            logger.info("Creating %s on %s", index['IndexName'], table_name)
+            await _wait_until_active(client, table_name, index['IndexName'])
+
+async def backfill_index_keys(db_service: DatabaseService):
+    await db_service.backfill_index_keys()
+
+async def backfill_user_totals(db_service: DatabaseService):
+    await db_service.backfill_user_totals()
+
+COMMANDS = {
+    'create-tables': create_tables,
+    'create-indexes': create_indexes,
+    'backfill-index-keys': backfill_index_keys,
+    'backfill-user-totals': backfill_user_totals
+}
+
+async def main(command: str, region_name: str):
+    db_service = DatabaseService(region_name=region_name)
+    await db_service.connect()
+    try:
+        await COMMANDS[command](db_service)
+    finally:
+        await db_service.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=COMMANDS)
+    parser.add_argument('--region', default='us-east-1')
+    args = parser.parse_args()
+    asyncio.run(main(args.command, args.region))
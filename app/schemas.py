@@ -0,0 +1,61 @@
+# schemas.py
+from typing import Any, Dict, List, Literal
+from pydantic import BaseModel, StrictBool
+
+# Request bodies are parsed and validated by FastAPI against these models
+# in pydantic-core before the handler runs
+
+# Image types the vision model accepts as data URLs
+ImageFormat = Literal['jpeg', 'png', 'gif', 'webp']
+
+class CaptionImageRequest(BaseModel):
+    # Either base64 image_data, or an image_url the model can fetch directly
+    image_data: str = ''
+    image_format: ImageFormat = 'jpeg'
+    image_url: str = ''
+
+class GenerateStoryRequest(BaseModel):
+    captions: List[str]
+    user_context: str = ''
+    tone: str = 'heartwarming'
+
+class AnalyzeSentimentRequest(BaseModel):
+    story_content: str
+
+class GenerateTitleRequest(BaseModel):
+    story_content: str
+    sentiment_data: Dict[str, Any] = {}
+
+# Tones offered by the iOS app (MemoirTone)
+Tone = Literal['whimsical', 'nostalgic', 'adventurous', 'heartwarming']
+
+class ImageInput(BaseModel):
+    image_data: str
+    image_format: ImageFormat = 'jpeg'
+
+class MemoirCreateRequest(BaseModel):
+    user_id: str
+    images: List[ImageInput]
+    user_context: str = ''
+    tone: Tone = 'heartwarming'
+
+class CreateUserRequest(BaseModel):
+    email: str
+    preferences: Dict[str, Any] = {}
+
+class FavoriteUpdateRequest(BaseModel):
+    is_favorite: StrictBool
+
+class RegisterRequest(BaseModel):
+    email: str
+    password: str
+    preferences: Dict[str, Any] = {}
+
+class LoginRequest(BaseModel):
+    email: str
+    password: str
+
+class ChangePasswordRequest(BaseModel):
+    user_id: str
+    current_password: str
+    new_password: str
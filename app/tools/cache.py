@@ -0,0 +1,55 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+def content_key(*parts) -> str:
+    """
+    Hash str/bytes parts into a compact cache key.
+    Each part is length-prefixed so ('ab', 'c') and ('a', 'bc') never collide.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+class TTLCache:
+    """
+    In-process LRU cache whose entries expire ttl seconds after being set.
+    Not thread-safe: meant to be used from the event loop.
+    """
+    def __init__(self, maxsize: int = 4096, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        item = self._items.get(key)
+        if item is None:
+            return None
+
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            return None
+
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry when full"""
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        """Drop a key if present"""
+        self._items.pop(key, None)
+
+    def __len__(self):
+        return len(self._items)
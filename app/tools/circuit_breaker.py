@@ -0,0 +1,68 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling through while the breaker is open"""
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a while.
+    After failure_threshold consecutive failures the breaker opens and calls fail fast with
+    CircuitOpenError; once reset_timeout seconds pass, one probe call is let through and
+    its outcome closes or re-opens the breaker.
+    Not thread-safe: meant to be used from the event loop.
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args,
+                   is_failure: Optional[Callable[[Any], bool]] = None, **kwargs) -> Any:
+        """
+        Await fn(*args, **kwargs) through the breaker.
+        is_failure lets tools that return error values instead of raising count as failures.
+        """
+        probe = False
+        if self._opened_at is not None:
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            probe = self._probing = True
+
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception:
+            self._record_failure()
+            raise
+        finally:
+            if probe:
+                self._probing = False
+
+        if is_failure is not None and is_failure(result):
+            self._record_failure()
+        else:
+            self._record_success()
+        return result
+
+    def _record_failure(self):
+        self._failures += 1
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warning("%s circuit opened after %s consecutive failures", self.name, self._failures)
+            self._opened_at = time.monotonic()
+
+    def _record_success(self):
+        if self._opened_at is not None:
+            logger.info("%s circuit closed", self.name)
+        self._failures = 0
+        self._opened_at = None
@@ -1,30 +1,299 @@
-import boto3
-import uuid
-from datetime import datetime
-from typing import Dict, List, Optional
+import aioboto3
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack
+from functools import partial
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import logging
-from botocore.exceptions import ClientError
+import operator
+import re
+from aiobotocore.config import AioConfig
+from boto3.dynamodb.types import Binary, TypeDeserializer, TypeSerializer
+from botocore.exceptions import BotoCoreError, ClientError
+from config.settings import settings
+from tools.cache import TTLCache
 import bcrypt
 import secrets
 
 logger = logging.getLogger(__name__)
 
+USERS_TABLE = 'MemoirAI-Users'
+JOURNAL_TABLE = 'MemoirAI-JournalEntries'
+
+# (epoch second, formatted prefix) of the last timestamp: the strftime runs once per second
+_LAST_SECOND = [-1, '']
+
+def _utc_now_iso(_time_ns=time.time_ns, _gmtime=time.gmtime, _strftime=time.strftime) -> str:
+    """
+    Current UTC time as 2025-08-20T23:24:55.123456Z, the format every stored timestamp uses.
+    Built from time_ns with the per-second prefix cached, and microseconds are always present
+    (datetime.isoformat drops them when they happen to be zero, which breaks string ordering).
+    """
+    seconds, micros = divmod(_time_ns() // 1000, 1_000_000)
+    if seconds != _LAST_SECOND[0]:
+        _LAST_SECOND[:] = seconds, _strftime('%Y-%m-%dT%H:%M:%S', _gmtime(seconds))
+    return f"{_LAST_SECOND[1]}.{micros:06d}Z"
+
+# Timestamp -> entry ID segment: ':' and '.' become '-' in one pass
+_ENTRY_ID_TRANS = str.maketrans(':.', '--')
+
+# Counts words in one pass without building the token list that str.split() would
+_WORD_RE = re.compile(r'\S+')
+
+def count_words(text: str) -> int:
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+def _iso_to_ms(timestamp: str) -> int:
+    """Epoch milliseconds for an ISO timestamp (the numeric created_at_ms sort key); naive means UTC"""
+    parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+# One session and one resource per region for the whole process, so every handler
+# shares the same HTTP connection pool instead of paying a TLS handshake per call
+_SESSION = aioboto3.Session()
+_CONFIG = AioConfig(
+    max_pool_connections=64,
+    retries={'max_attempts': 5, 'mode': 'adaptive'},
+    # Fail fast on a stuck connection and let the retry take another one, instead of
+    # waiting out botocore's 60s defaults; DynamoDB answers single calls in milliseconds
+    connect_timeout=1,
+    read_timeout=3,
+    # Keep idle pooled connections for a minute (aiohttp's default is 12s), so traffic
+    # with short gaps reuses them instead of reconnecting. botocore's tcp_keepalive flag
+    # is a socket option aiobotocore's aiohttp session doesn't apply, so it isn't set.
+    connector_args={'keepalive_timeout': 60}
+)
+_RESOURCES = {}
+_RESOURCE_STACK = AsyncExitStack()
+_RESOURCE_LOCK = asyncio.Lock()
+
+async def get_dynamodb_resource(region_name: str):
+    """Return the shared DynamoDB resource for a region, opening it on first use"""
+    if region_name not in _RESOURCES:
+        async with _RESOURCE_LOCK:
+            if region_name not in _RESOURCES:
+                _RESOURCES[region_name] = await _RESOURCE_STACK.enter_async_context(
+                    _SESSION.resource('dynamodb', region_name=region_name, config=_CONFIG)
+                )
+    return _RESOURCES[region_name]
+
+async def close_dynamodb_resources():
+    """Close every shared resource and its connection pool (call on shutdown)"""
+    _RESOURCES.clear()
+    await _RESOURCE_STACK.aclose()
+
+# Logins are written behind: repeat logins by one user within this window cost one write
+LAST_LOGIN_FLUSH_DELAY = 30.0
+# last_login is only kept to this granularity: a login within it of the stored value isn't written
+LAST_LOGIN_MIN_INTERVAL = 300.0
+
+def _last_login_stale(last_login: Optional[str]) -> bool:
+    """Whether a stored last_login is missing or older than LAST_LOGIN_MIN_INTERVAL"""
+    if not last_login:
+        return True
+    try:
+        return time.time() * 1000 - _iso_to_ms(last_login) > LAST_LOGIN_MIN_INTERVAL * 1000
+    except ValueError:
+        return True
+
+class NumberDeserializer(TypeDeserializer):
+    """
+    Deserialize DynamoDB numbers as int (or float) instead of Decimal. The stored numbers are
+    counts and scores: int arithmetic is far cheaper than Decimal and encodes to JSON natively.
+    """
+    def _deserialize_n(self, value):
+        if '.' in value or 'e' in value or 'E' in value:
+            return float(value)
+        return int(value)
+
+_SERIALIZER = TypeSerializer()
+_DESERIALIZER = NumberDeserializer()
+
+def serialize_item(item: Dict) -> Dict:
+    """Convert a plain item to the low-level attribute-value form that TransactWriteItems takes"""
+    return {key: _SERIALIZER.serialize(value) for key, value in item.items()}
+
+def deserialize_item(item: Dict) -> Dict:
+    """Convert a low-level client item back to plain Python values"""
+    return {key: _DESERIALIZER.deserialize(value) for key, value in item.items()}
+
+# Per-entry field readers for the stats loops: C-level calls instead of a generator frame per entry
+_WORD_COUNT = operator.methodcaller('get', 'word_count', 0)
+_PRIMARY_MOOD = operator.methodcaller('get', 'primary_mood', 'neutral')
+
+def _most_common_mood(mood_counts: Counter) -> str:
+    """The mood with the highest count, 'neutral' when there are none"""
+    top = mood_counts.most_common(1)
+    return top[0][0] if top else 'neutral'
+
+# Stats have always looked at the most recent 100 entries; recent_entries_count is how many that was
+RECENT_STATS_LIMIT = 100
+
+def _user_stats(total_entries: int, mood_counts: Counter, total_words: int,
+                counted_entries: int, recent_entries_count: int) -> Dict:
+    """The one shape every get_user_stats branch returns (the iOS UserStats model decodes all of it)"""
+    return {
+        'total_entries': total_entries,
+        'mood_distribution': dict(mood_counts),
+        'avg_word_count': total_words // counted_entries if counted_entries else 0,
+        'recent_entries_count': recent_entries_count,
+        'most_common_mood': _most_common_mood(mood_counts)
+    }
+
+# Users carry running totals (total_entries, total_words, mood_count_<mood>) so stats
+# never have to re-read entries. Flat attributes rather than a map: ADD on a path inside
+# a map fails until the map exists, while ADD on a missing top-level attribute starts at 0.
+MOOD_COUNT_PREFIX = 'mood_count_'
+
+def totals_update(entries: List[Dict], sign: int = 1, replace: bool = False) -> Dict:
+    """
+    UpdateItem kwargs that ADD (sign=1) or take away (sign=-1) the entries' share of the user's totals
+    With replace=True the totals are SET to the entries' values instead
+    """
+    moods = Counter(entry.get('primary_mood', 'neutral') for entry in entries)
+    terms = [('total_entries', ':entries'), ('total_words', ':words')]
+    names = {}
+    values = {
+        ':entries': sign * len(entries),
+        ':words': sign * sum(int(entry.get('word_count', 0)) for entry in entries)
+    }
+    for i, (mood, count) in enumerate(moods.items()):
+        terms.append((f'#mood{i}', f':mood{i}'))
+        names[f'#mood{i}'] = f'{MOOD_COUNT_PREFIX}{mood}'
+        values[f':mood{i}'] = sign * count
+    return {
+        'UpdateExpression': (
+            'SET ' + ', '.join(f'{name} = {value}' for name, value in terms) if replace
+            else 'ADD ' + ', '.join(f'{name} {value}' for name, value in terms)
+        ),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+
+def projection_kwargs(fields: Optional[List[str]]) -> Dict:
+    """
+    Build ProjectionExpression kwargs for a read that only needs some attributes.
+    Names go through placeholders since attributes like 'date' or 'name' are reserved words.
+    """
+    if not fields:
+        return {}
+    names = {f'#p{i}': field for i, field in enumerate(fields)}
+    return {
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+
+# bcrypt is deliberately CPU-heavy; hashing runs on a pool sized to this process's share of
+# the cores so a burst of sign-ups queues for cores instead of oversubscribing them and
+# starving other requests
+_PASSWORD_POOL = ThreadPoolExecutor(max_workers=settings.BCRYPT_THREADS, thread_name_prefix='bcrypt')
+
+def _bcrypt_hash(password: str) -> bytes:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS))
+
+def _bcrypt_check(password: str, stored_hash: bytes) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), stored_hash)
+
+def _bcrypt_rounds(stored_hash: bytes) -> int:
+    """Cost factor of a bcrypt hash ($2b$<rounds>$...), 0 if it can't be read"""
+    try:
+        return int(stored_hash[4:6])
+    except ValueError:
+        return 0
+
+def _stored_hash_bytes(stored_hash) -> bytes:
+    """password_hash is a Binary attribute; accounts created before that hold a str"""
+    if isinstance(stored_hash, Binary):
+        return stored_hash.value
+    if isinstance(stored_hash, str):
+        return stored_hash.encode('utf-8')
+    return stored_hash or b''
+
 class DatabaseService:
     def __init__(self, region_name='us-east-1'):
-        """Initialize DynamoDB connection"""
-        self.dynamodb = boto3.resource('dynamodb', region_name=region_name)
-        self.users_table = self.dynamodb.Table('MemoirAI-Users')
-        self.journal_table = self.dynamodb.Table('MemoirAI-JournalEntries')
+        """Tables are resolved lazily: the aioboto3 resource has to be opened inside the event loop"""
+        self.region_name = region_name
+        self.dynamodb = None
+        self.users_table = None
+        self.journal_table = None
+        self._bind_client_calls(None)
+        # email -> user_id. User and entry rows are not cached: they are mutable and every
+        # worker process would hold its own stale copy. This mapping never changes once an
+        # account exists, so it is safe per process and turns repeat email lookups into a key
+        # read instead of a GSI query
+        self._email_cache = TTLCache(maxsize=10_000, ttl=3600)
+        # user_id -> latest login timestamp not yet written, and the task that will write them
+        self._pending_logins = {}
+        self._login_flush = None
+        # user_id -> background task bringing that user's password hash up to policy
+        self._hash_upgrades = {}
+
+    async def connect(self):
+        """Open the shared DynamoDB resource and bind the table handles"""
+        if self.dynamodb is None:
+            self.dynamodb = await get_dynamodb_resource(self.region_name)
+            self.users_table = await self.dynamodb.Table(USERS_TABLE)
+            self.journal_table = await self.dynamodb.Table(JOURNAL_TABLE)
+            self._bind_client_calls(self.dynamodb.meta.client)
+
+    def _bind_client_calls(self, client):
+        """
+        Pre-bind the low-level client calls the hot paths use, table name included,
+        so each request skips the attribute lookups and resource-action wrapping
+        """
+        if client is None:
+            self._get_user_item = self._query_users = None
+            self._get_journal_item = self._query_journal = self._transact_write = None
+            return
+        self._get_user_item = partial(client.get_item, TableName=USERS_TABLE)
+        self._query_users = partial(client.query, TableName=USERS_TABLE)
+        self._get_journal_item = partial(client.get_item, TableName=JOURNAL_TABLE)
+        self._query_journal = partial(client.query, TableName=JOURNAL_TABLE)
+        self._transact_write = client.transact_write_items
+
+    async def close(self):
+        """
+        Write out pending logins, then release the shared resource (call on shutdown).
+        Table handles and bound client calls are dropped, so the service can't be used
+        again until connect() is called.
+        """
+        if self._login_flush is not None:
+            self._login_flush.cancel()
+            self._login_flush = None
+        await self.flush_last_logins()
+        if self._hash_upgrades:
+            await asyncio.gather(*self._hash_upgrades.values())
+
+        self.dynamodb = None
+        self.users_table = None
+        self.journal_table = None
+        self._bind_client_calls(None)
+        await close_dynamodb_resources()
+
+    async def ping(self) -> bool:
+        """Cheap connectivity check: DescribeTable on the journal table through the shared pool"""
+        try:
+            await self.connect()
+            await self.dynamodb.meta.client.describe_table(TableName=JOURNAL_TABLE)
+            return True
+        except (BotoCoreError, ClientError) as e:
+            logger.error("Database health check failed: %s", e)
+            return False
         
     # ==================================================================================
     # USER OPERATIONS
     # ==================================================================================
     
-    def create_user(self, email: str, preferences: Dict = None) -> str:
+    async def create_user(self, email: str, preferences: Dict = None) -> str:
         """Create a new user and return user_id"""
         try:
-            user_id = f"user_{str(uuid.uuid4())[:8]}"
-            timestamp = datetime.utcnow().isoformat() + 'Z'
+            user_id = f"user_{secrets.token_hex(4)}"
+            timestamp = _utc_now_iso()
             
             user_item = {
                 'user_id': user_id,
@@ -40,67 +309,101 @@ class DatabaseService:
                 'total_entries': 0
             }
             
-            self.users_table.put_item(Item=user_item)
-            logger.info(f"Created user: {user_id}")
+            await self.users_table.put_item(Item=user_item)
+            logger.info("Created user: %s", user_id)
             return user_id
             
         except ClientError as e:
-            logger.error(f"Error creating user: {e}")
+            logger.error("Error creating user: %s", e)
             raise
     
-    def get_user(self, user_id: str) -> Optional[Dict]:
+    async def get_user(self, user_id: str) -> Optional[Dict]:
         """Get user by user_id"""
         try:
-            response = self.users_table.get_item(Key={'user_id': user_id})
-            return response.get('Item')
+            response = await self._get_user_item(Key={'user_id': {'S': user_id}})
+            user = response.get('Item')
+            return deserialize_item(user) if user else None
         except ClientError as e:
-            logger.error(f"Error getting user {user_id}: {e}")
+            logger.error("Error getting user %s: %s", user_id, e)
             return None
     
-    def get_user_by_email(self, email: str) -> Optional[Dict]:
-        """Get user by email using GSI"""
+    async def get_user_by_email(self, email: str) -> Optional[Dict]:
+        """
+        Get user by email using GSI
+        Emails seen before resolve to their user_id from memory and are read through get_user
+        Both paths go through the low-level client, so numbers come back as int/float either way
+        """
+        user_id = self._email_cache.get(email)
+        if user_id is not None:
+            return await self.get_user(user_id)
+
         try:
-            response = self.users_table.query(
+            response = await self._query_users(
                 IndexName='EmailIndex',
                 KeyConditionExpression='email = :email',
-                ExpressionAttributeValues={':email': email}
+                ExpressionAttributeValues={':email': {'S': email}}
             )
             items = response.get('Items', [])
-            return items[0] if items else None
+            if not items:
+                return None
+            user = deserialize_item(items[0])
+            self._email_cache.set(email, user['user_id'])
+            return user
         except ClientError as e:
-            logger.error(f"Error getting user by email {email}: {e}")
+            logger.error("Error getting user by email %s: %s", email, e)
             return None
     
-    def update_user_last_login(self, user_id: str):
-        """Update user's last login timestamp"""
+    def record_last_login(self, user_id: str):
+        """
+        Note a login without waiting on the write: timestamps are buffered per user and
+        written together LAST_LOGIN_FLUSH_DELAY seconds later (or on close)
+        """
+        self._pending_logins[user_id] = _utc_now_iso()
+        if self._login_flush is None or self._login_flush.done():
+            self._login_flush = asyncio.create_task(self._flush_last_logins_later())
+
+    async def _flush_last_logins_later(self):
+        await asyncio.sleep(LAST_LOGIN_FLUSH_DELAY)
+        await self.flush_last_logins()
+
+    async def flush_last_logins(self):
+        """Write every buffered login, one update per user"""
+        pending, self._pending_logins = self._pending_logins, {}
+        if pending:
+            await asyncio.gather(*(
+                self.update_user_last_login(user_id, timestamp) for user_id, timestamp in pending.items()
+            ))
+
+    async def update_user_last_login(self, user_id: str, timestamp: str = None):
+        """Update user's last login timestamp (now, unless given)"""
         try:
-            timestamp = datetime.utcnow().isoformat() + 'Z'
-            self.users_table.update_item(
+            timestamp = timestamp or _utc_now_iso()
+            await self.users_table.update_item(
                 Key={'user_id': user_id},
                 UpdateExpression='SET last_login = :timestamp',
                 ExpressionAttributeValues={':timestamp': timestamp}
             )
         except ClientError as e:
-            logger.error(f"Error updating last login for {user_id}: {e}")
+            logger.error("Error updating last login for %s: %s", user_id, e)
     
-    def create_user_with_password(self, email: str, password: str, preferences: Dict = None) -> str:
+    async def create_user_with_password(self, email: str, password: str, preferences: Dict = None) -> str:
         """Create a new user with hashed password"""
         try:
             # Check if user already exists
-            existing_user = self.get_user_by_email(email)
+            existing_user = await self.get_user_by_email(email)
             if existing_user:
                 raise ValueError("User with this email already exists")
             
-            user_id = f"user_{str(uuid.uuid4())[:8]}"
-            timestamp = datetime.utcnow().isoformat() + 'Z'
+            user_id = f"user_{secrets.token_hex(4)}"
+            timestamp = _utc_now_iso()
             
             # Hash the password
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            password_hash = await self._hash_password(password)
             
             user_item = {
                 'user_id': user_id,
                 'email': email,
-                'password_hash': password_hash,
+                'password_hash': Binary(password_hash),
                 'created_at': timestamp,
                 'last_login': timestamp,
                 'preferences': preferences or {
@@ -113,18 +416,18 @@ class DatabaseService:
                 'is_active': True
             }
             
-            self.users_table.put_item(Item=user_item)
-            logger.info(f"Created user with password: {user_id}")
+            await self.users_table.put_item(Item=user_item)
+            logger.info("Created user with password: %s", user_id)
             return user_id
             
         except ClientError as e:
-            logger.error(f"Error creating user with password: {e}")
+            logger.error("Error creating user with password: %s", e)
             raise
 
-    def authenticate_user(self, email: str, password: str) -> Optional[Dict]:
+    async def authenticate_user(self, email: str, password: str) -> Optional[Dict]:
         """Authenticate user with email and password"""
         try:
-            user = self.get_user_by_email(email)
+            user = await self.get_user_by_email(email)
             if not user:
                 return None
             
@@ -133,342 +436,622 @@ class DatabaseService:
                 return None
             
             # Verify password
-            stored_hash = user.get('password_hash', '')
-            if bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8')):
-                # Update last login
-                self.update_user_last_login(user['user_id'])
+            if await self.verify_password(user, password):
+                # Rehashing costs a full bcrypt round plus a write: do it after the response
+                if user['user_id'] not in self._hash_upgrades:
+                    self._start_hash_upgrade(user, password)
+
+                # Update last login (buffered, off the request path) unless it is still fresh
+                if _last_login_stale(user.get('last_login')):
+                    self.record_last_login(user['user_id'])
                 return user
             
             return None
             
         except Exception as e:
-            logger.error(f"Error authenticating user: {e}")
+            logger.error("Error authenticating user: %s", e)
             return None
 
-    def update_user_password(self, user_id: str, new_password: str) -> bool:
+    def _start_hash_upgrade(self, user: Dict, password: str):
+        """Run _upgrade_password_hash in the background, at most once per user at a time"""
+        user_id = user['user_id']
+        task = asyncio.create_task(self._upgrade_password_hash(user, password))
+        self._hash_upgrades[user_id] = task
+        task.add_done_callback(lambda _: self._hash_upgrades.pop(user_id, None))
+
+    async def _upgrade_password_hash(self, user: Dict, password: str):
+        """
+        Bring a verified user's stored hash in line with policy while the plaintext is at hand:
+        rehash at BCRYPT_ROUNDS if it was made at another cost, and move legacy string hashes
+        to the Binary attribute. Best-effort: a failed write is logged and retried next login,
+        never turned into a failed login.
+        """
+        try:
+            stored_hash = _stored_hash_bytes(user['password_hash'])
+            if _bcrypt_rounds(stored_hash) != settings.BCRYPT_ROUNDS:
+                await self._store_password_hash(user['user_id'], await self._hash_password(password))
+            elif isinstance(user['password_hash'], str):
+                await self._store_password_hash(user['user_id'], stored_hash)
+        except Exception as e:
+            logger.warning("Could not upgrade password hash for %s: %s", user['user_id'], e)
+
+    async def update_user_password(self, user_id: str, new_password: str) -> bool:
         """Update user password"""
         try:
-            password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            
-            self.users_table.update_item(
-                Key={'user_id': user_id},
-                UpdateExpression='SET password_hash = :hash, updated_at = :timestamp',
-                ExpressionAttributeValues={
-                    ':hash': password_hash,
-                    ':timestamp': datetime.utcnow().isoformat() + 'Z'
-                }
-            )
+            password_hash = await self._hash_password(new_password)
+            await self._store_password_hash(user_id, password_hash)
             return True
         except ClientError as e:
-            logger.error(f"Error updating password: {e}")
+            logger.error("Error updating password: %s", e)
             return False
 
+    async def verify_password(self, user: Dict, password: str) -> bool:
+        """Check a password against the user's stored bcrypt hash on the dedicated pool"""
+        stored_hash = _stored_hash_bytes(user.get('password_hash'))
+        if not stored_hash:
+            return False
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_PASSWORD_POOL, _bcrypt_check, password, stored_hash)
+
+    async def _store_password_hash(self, user_id: str, password_hash: bytes):
+        """Write a bcrypt hash as a Binary attribute so reads hand bcrypt bytes directly"""
+        await self.users_table.update_item(
+            Key={'user_id': user_id},
+            UpdateExpression='SET password_hash = :hash, updated_at = :timestamp',
+            ExpressionAttributeValues={
+                ':hash': Binary(password_hash),
+                ':timestamp': _utc_now_iso()
+            }
+        )
+
+    async def _hash_password(self, password: str) -> bytes:
+        """Hash a password on the dedicated bcrypt pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_PASSWORD_POOL, _bcrypt_hash, password)
+
     # ==================================================================================
     # JOURNAL ENTRY OPERATIONS
     # ==================================================================================
     
-    def save_journal_entry(self, user_id: str, title: str, story_content: str, 
+    def _new_entry_item(self, user_id: str, title: str, story_content: str,
+                        user_context: str = "", tone: str = "heartwarming",
+                        images: List[Dict] = None, sentiment_analysis: Dict = None,
+                        content_hash: str = None, word_count: int = None) -> Dict:
+        """Build the item for a new journal entry, with a fresh URL-friendly ID"""
+        timestamp = _utc_now_iso()
+        entry_uuid = secrets.token_hex(4)
+        
+        # NEW: URL-friendly entry ID format
+        # Instead of: ENTRY#2025-08-20T23:24:55.123456Z#abc12345
+        # Use: ENTRY_2025-08-20T23-24-55-123456Z_abc12345
+        timestamp_clean = timestamp.translate(_ENTRY_ID_TRANS)
+        entry_id = f"ENTRY_{timestamp_clean}_{entry_uuid}"
+        
+        logger.info("Creating entry with URL-friendly ID: %s", entry_id)
+        
+        primary_mood = sentiment_analysis.get('primary_mood', 'neutral') if sentiment_analysis else 'neutral'
+
+        # Calculate word count unless the caller already did
+        if word_count is None:
+            word_count = count_words(story_content)
+        estimated_read_time = f"{max(1, word_count // 200)} min"
+        
+        entry_item = {
+            'user_id': user_id,
+            'entry_id': entry_id,
+            'created_at': timestamp,
+            # DateMsIndex sort key: a fixed-width number is a smaller key than the ISO string
+            'created_at_ms': _iso_to_ms(timestamp),
+            'updated_at': timestamp,
+            'title': title,
+            'story_content': story_content,
+            'user_context': user_context,
+            'tone': tone,
+            'images': images or [],  # stored inline: one PutItem however many images
+            'sentiment_analysis': sentiment_analysis or {},
+            'primary_mood': primary_mood,
+            # MoodDateIndex sort key: entries of one mood come back in date order
+            'mood_created_at': f"{primary_mood}#{timestamp}",
+            'word_count': word_count,
+            'estimated_read_time': estimated_read_time,
+            'is_favorite': False,
+            'privacy_level': 'private',
+            'tags': []
+        }
+        if content_hash:
+            entry_item['content_hash'] = content_hash
+        return entry_item
+
+    async def save_journal_entry(self, user_id: str, title: str, story_content: str, 
                       user_context: str = "", tone: str = "heartwarming",
-                      images: List[Dict] = None, sentiment_analysis: Dict = None) -> str:
-        """Save a complete journal entry with URL-friendly ID"""
+                      images: List[Dict] = None, sentiment_analysis: Dict = None,
+                      content_hash: str = None, word_count: int = None) -> Tuple[str, str]:
+        """
+        Save a complete journal entry with URL-friendly ID
+        Returns (entry_id, created_at); pass word_count if the caller already counted it
+        content_hash (a digest of the inputs) lets get_entry_by_hash spot resubmissions
+        """
         try:
-            timestamp = datetime.utcnow().isoformat() + 'Z'
-            entry_uuid = str(uuid.uuid4())[:8]
-            
-            # NEW: URL-friendly entry ID format
-            # Instead of: ENTRY#2025-08-20T23:24:55.123456Z#abc12345
-            # Use: ENTRY_2025-08-20T23-24-55-123456Z_abc12345
-            timestamp_clean = timestamp.replace(':', '-').replace('.', '-')
-            entry_id = f"ENTRY_{timestamp_clean}_{entry_uuid}"
-            
-            logger.info(f"Creating entry with URL-friendly ID: {entry_id}")
-            
-            # Calculate word count
-            word_count = len(story_content.split())
-            estimated_read_time = f"{max(1, word_count // 200)} min"
-            
-            entry_item = {
-                'user_id': user_id,
-                'entry_id': entry_id,
-                'created_at': timestamp,
-                'updated_at': timestamp,
-                'title': title,
-                'story_content': story_content,
-                'user_context': user_context,
-                'tone': tone,
-                'images': images or [],
-                'sentiment_analysis': sentiment_analysis or {},
-                'primary_mood': sentiment_analysis.get('primary_mood', 'neutral') if sentiment_analysis else 'neutral',
-                'word_count': word_count,
-                'estimated_read_time': estimated_read_time,
-                'is_favorite': False,
-                'privacy_level': 'private',
-                'tags': []
-            }
-            
-            # Save the entry
-            self.journal_table.put_item(Item=entry_item)
-            
-            # Update user's total entry count
-            self.users_table.update_item(
-                Key={'user_id': user_id},
-                UpdateExpression='ADD total_entries :inc',
-                ExpressionAttributeValues={':inc': 1}
+            entry_item = self._new_entry_item(
+                user_id, title, story_content, user_context, tone,
+                images, sentiment_analysis, content_hash, word_count
             )
+            entry_id, timestamp = entry_item['entry_id'], entry_item['created_at']
             
-            logger.info(f"Saved journal entry: {entry_id} for user: {user_id}")
-            return entry_id
+            # Write the entry and bump the user's totals in one atomic round trip
+            try:
+                await self._transact_write(TransactItems=[
+                    {'Put': {'TableName': JOURNAL_TABLE, 'Item': serialize_item(entry_item)}},
+                    {'Update': self._transact_totals_update(user_id, [entry_item])}
+                ])
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                logger.warning("Save transaction cancelled for %s, writing separately: %s", entry_id, e)
+                await self._put_entry_and_count(user_id, entry_item)
+            
+            logger.info("Saved journal entry: %s for user: %s", entry_id, user_id)
+            return entry_id, timestamp
 
         except ClientError as e:
-            logger.error(f"Error saving journal entry: {e}")
+            logger.error("Error saving journal entry: %s", e)
             raise
 
-    
-    def get_user_entries(self, user_id: str, limit: int = 20, newest_first: bool = True) -> List[Dict]:
-        """Get user's journal entries (newest first by default)"""
+    async def _put_entry_and_count(self, user_id: str, entry_item: Dict):
+        """Fallback for a cancelled save transaction: the entry write and the totals bump in parallel"""
+        put_result, count_result = await asyncio.gather(
+            self.journal_table.put_item(Item=entry_item),
+            self.users_table.update_item(Key={'user_id': user_id}, **totals_update([entry_item])),
+            return_exceptions=True
+        )
+
+        if isinstance(put_result, Exception):
+            # The totals were bumped for an entry that was never written: undo it
+            if not isinstance(count_result, Exception):
+                await self._adjust_user_totals(user_id, [entry_item], sign=-1)
+            raise put_result
+
+        if isinstance(count_result, Exception):
+            # The entry is saved; a drifted counter is not worth failing the request
+            logger.warning("Could not update entry count for user %s: %s", user_id, count_result)
+
+    def _transact_totals_update(self, user_id: str, entries: List[Dict], sign: int = 1) -> Dict:
+        """totals_update as a TransactWriteItems Update on the users table"""
+        totals = totals_update(entries, sign)
+        update = {
+            'TableName': USERS_TABLE,
+            'Key': {'user_id': {'S': user_id}},
+            'UpdateExpression': totals['UpdateExpression'],
+            'ExpressionAttributeValues': serialize_item(totals['ExpressionAttributeValues'])
+        }
+        if totals['ExpressionAttributeNames']:
+            update['ExpressionAttributeNames'] = totals['ExpressionAttributeNames']
+        return update
+
+    async def _adjust_user_totals(self, user_id: str, entries: List[Dict], sign: int = 1):
+        """Apply entries to the user's totals (compensating half-failed writes); logs instead of raising"""
         try:
-            response = self.journal_table.query(
-                KeyConditionExpression='user_id = :user_id',
-                ExpressionAttributeValues={':user_id': user_id},
-                ScanIndexForward=not newest_first,  # False = descending (newest first)
-                Limit=limit
-            )
-            return response.get('Items', [])
+            await self.users_table.update_item(Key={'user_id': user_id}, **totals_update(entries, sign))
         except ClientError as e:
-            logger.error(f"Error getting entries for user {user_id}: {e}")
-            return []
+            logger.error("Could not adjust totals for user %s by %s entries: %s", user_id, sign * len(entries), e)
     
-    def get_entry_by_id(self, user_id: str, entry_id: str) -> Optional[Dict]:
+    async def get_user_entries(self, user_id: str, limit: int = 20, newest_first: bool = True,
+                               fields: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Get user's journal entries (newest first by default)
+        Pass fields to fetch only those attributes, e.g. a listing that skips story_content
+        """
+        entries = []
+        async for page in self.iter_user_entries(user_id, limit, newest_first, fields=fields):
+            entries.extend(page)
+        return entries
+
+    async def iter_user_entries(self, user_id: str, limit: int = 20, newest_first: bool = True,
+                                page_size: int = 100, fields: Optional[List[str]] = None) -> AsyncIterator[List[Dict]]:
+        """
+        Yield the user's journal entries page by page, following LastEvaluatedKey
+        until limit entries have been returned. Query errors propagate: swallowing one
+        would end the listing early and pass it off as complete
+        """
+        async for page in self._query_pages(
+            limit, page_size,
+            KeyConditionExpression='user_id = :user_id',
+            ExpressionAttributeValues={':user_id': user_id},
+            ScanIndexForward=not newest_first,  # False = descending (newest first)
+            **projection_kwargs(fields)
+        ):
+            yield page
+
+    async def _query_pages(self, limit: Optional[int], page_size: int, **query_kwargs) -> AsyncIterator[List[Dict]]:
+        """
+        Run a journal table query page by page, following LastEvaluatedKey until limit items
+        have been yielded (limit=None: until the results run out). Each page is at most page_size
+        items, so callers that stop early never pull more than they use.
+        """
+        # Hot read path: the low-level client skips the resource layer's per-call
+        # parameter transformation; items are deserialized once here
+        query_kwargs['ExpressionAttributeValues'] = serialize_item(query_kwargs['ExpressionAttributeValues'])
+
+        remaining = limit
+        while remaining is None or remaining > 0:
+            response = await self._query_journal(
+                Limit=page_size if remaining is None else min(remaining, page_size),
+                **query_kwargs
+            )
+            items = [deserialize_item(item) for item in response.get('Items', [])]
+            if remaining is not None:
+                remaining -= len(items)
+            if items:
+                yield items
+
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            query_kwargs['ExclusiveStartKey'] = last_key
+    
+    async def get_entry_by_id(self, user_id: str, entry_id: str) -> Optional[Dict]:
         """Get specific journal entry with better error handling"""
         try:
-            logger.info(f"Getting entry {entry_id} for user {user_id}")
+            logger.info("Getting entry %s for user %s", entry_id, user_id)
             
-            response = self.journal_table.get_item(
-                Key={'user_id': user_id, 'entry_id': entry_id}
-            )
+            response = await self._get_journal_item(Key={'user_id': {'S': user_id}, 'entry_id': {'S': entry_id}})
             
             entry = response.get('Item')
             if entry:
-                logger.info(f"Found entry {entry_id}")
+                entry = deserialize_item(entry)
+                logger.info("Found entry %s", entry_id)
                 return entry
             else:
-                logger.warning(f"Entry {entry_id} not found for user {user_id}")
+                logger.warning("Entry %s not found for user %s", entry_id, user_id)
                 return None
                 
         except ClientError as e:
-            logger.error(f"Error getting entry {entry_id}: {e}")
+            logger.error("Error getting entry %s: %s", entry_id, e)
             return None
         except Exception as e:
-            logger.error(f"Unexpected error getting entry {entry_id}: {e}")
+            logger.error("Unexpected error getting entry %s: %s", entry_id, e)
             return None
 
-    
-    def get_entries_by_date_range(self, user_id: str, start_date: str, end_date: str) -> List[Dict]:
-        """Get entries within a date range using DateIndex"""
+    async def get_entry_by_hash(self, user_id: str, content_hash: str) -> Optional[Dict]:
+        """
+        Find an entry the user already created from the same inputs, using ContentHashIndex
+        Returns None when there is no match or the index isn't enabled (DYNAMO_NEW_INDEXES)
+        """
+        if not settings.DYNAMO_NEW_INDEXES:
+            return None
         try:
-            response = self.journal_table.query(
-                IndexName='DateIndex',
-                KeyConditionExpression='user_id = :user_id AND created_at BETWEEN :start_date AND :end_date',
+            response = await self.journal_table.query(
+                IndexName='ContentHashIndex',
+                KeyConditionExpression='user_id = :user_id AND content_hash = :content_hash',
                 ExpressionAttributeValues={
+                    ':user_id': user_id,
+                    ':content_hash': content_hash
+                },
+                Limit=1
+            )
+            items = response.get('Items', [])
+            if not items:
+                return None
+
+            # The index may only project keys; hydrate from the base table if so
+            entry = items[0]
+            if 'story_content' not in entry:
+                entry = await self.get_entry_by_id(user_id, entry['entry_id'])
+            return entry
+
+        except ClientError as e:
+            # Dedupe is best-effort: a failed lookup creates the entry rather than failing the request
+            if e.response['Error']['Code'] == 'ValidationException':
+                logger.error("ContentHashIndex is missing; run migrations.py create-indexes: %s", e)
+            else:
+                logger.warning("Content hash lookup failed, skipping dedupe: %s", e)
+            return None
+
+    async def get_entries_by_date_range(self, user_id: str, start_date: str, end_date: str,
+                                        fields: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Get entries within a date range using DateIndex
+        Pass fields to fetch only those attributes, e.g. just primary_mood for a histogram
+        """
+        entries = []
+        async for page in self.iter_entries_by_date_range(user_id, start_date, end_date, fields=fields):
+            entries.extend(page)
+        return entries
+
+    async def iter_entries_by_date_range(self, user_id: str, start_date: str, end_date: str,
+                                         page_size: int = 100,
+                                         fields: Optional[List[str]] = None) -> AsyncIterator[List[Dict]]:
+        """
+        Yield every entry within a date range page by page, oldest first
+        Reads DateMsIndex (numeric created_at_ms) when DYNAMO_NEW_INDEXES is on, DateIndex otherwise
+        """
+        if settings.DYNAMO_NEW_INDEXES:
+            query_kwargs = {
+                'IndexName': 'DateMsIndex',
+                'KeyConditionExpression': 'user_id = :user_id AND created_at_ms BETWEEN :start_ms AND :end_ms',
+                'ExpressionAttributeValues': {
+                    ':user_id': user_id,
+                    ':start_ms': _iso_to_ms(start_date),
+                    ':end_ms': _iso_to_ms(end_date)
+                }
+            }
+        else:
+            query_kwargs = {
+                'IndexName': 'DateIndex',
+                'KeyConditionExpression': 'user_id = :user_id AND created_at BETWEEN :start_date AND :end_date',
+                'ExpressionAttributeValues': {
                     ':user_id': user_id,
                     ':start_date': start_date,
                     ':end_date': end_date
                 }
-            )
-            return response.get('Items', [])
+            }
+        try:
+            async for page in self._query_pages(None, page_size, **query_kwargs, **projection_kwargs(fields)):
+                yield page
         except ClientError as e:
-            logger.error(f"Error getting entries by date range: {e}")
-            return []
+            logger.error("Error getting entries by date range: %s", e)
     
-    def get_favorite_entries(self, user_id: str, limit: int = 20, newest_first: bool = True) -> List[Dict]:
+    async def get_favorite_entries(self, user_id: str, limit: int = 20, newest_first: bool = True,
+                                   fields: Optional[List[str]] = None) -> List[Dict]:
         """
         Get user's favorite journal entries only
-        Uses a filter expression to get only entries where is_favorite = true
+        Reads the sparse FavoritesIndex (only favorited entries carry favorite_created_at)
+        when DYNAMO_NEW_INDEXES is on, otherwise a filtered query of the user's entries
         """
         try:
-            logger.info(f"Getting favorite entries for user {user_id}, limit: {limit}")
-            
-            # Query all entries for the user, then filter for favorites
-            response = self.journal_table.query(
+            logger.info("Getting favorite entries for user %s, limit: %s", user_id, limit)
+
+            if settings.DYNAMO_NEW_INDEXES:
+                query_kwargs = {
+                    'IndexName': 'FavoritesIndex',
+                    'ExpressionAttributeValues': {':user_id': user_id}
+                }
+            else:
+                # Page through the user's entries and keep the favorites. Paging until limit
+                # matches are found replaces over-fetching limit * 2 and re-sorting; the
+                # filter doesn't change the query's order
+                query_kwargs = {
+                    'FilterExpression': 'is_favorite = :is_favorite',
+                    'ExpressionAttributeValues': {':user_id': user_id, ':is_favorite': True}
+                }
+
+            favorite_entries = []
+            async for page in self._query_pages(
+                limit, 50,
                 KeyConditionExpression='user_id = :user_id',
-                FilterExpression='is_favorite = :is_favorite',
-                ExpressionAttributeValues={
-                    ':user_id': user_id,
-                    ':is_favorite': True
-                },
                 ScanIndexForward=not newest_first,  # False = descending (newest first)
-                Limit=limit * 2  # Get more since we're filtering, then limit later
-            )
-            
-            entries = response.get('Items', [])
-            
-            # Sort by created_at if needed (since FilterExpression can affect order)
-            if newest_first:
-                entries.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-            else:
-                entries.sort(key=lambda x: x.get('created_at', ''))
-            
-            # Apply final limit
-            favorite_entries = entries[:limit]
+                **query_kwargs,
+                **projection_kwargs(fields)
+            ):
+                favorite_entries.extend(page)
             
-            logger.info(f"Found {len(favorite_entries)} favorite entries for user {user_id}")
+            logger.info("Found %s favorite entries for user %s", len(favorite_entries), user_id)
             return favorite_entries
             
         except ClientError as e:
-            logger.error(f"Error getting favorite entries for user {user_id}: {e}")
+            logger.error("Error getting favorite entries for user %s: %s", user_id, e)
             return []
         except Exception as e:
-            logger.error(f"Unexpected error getting favorite entries: {e}")
+            logger.error("Unexpected error getting favorite entries: %s", e)
             return []
 
-    def get_entries_by_mood(self, user_id: str, mood: str, limit: int = 20) -> List[Dict]:
-        """
-        Get entries filtered by specific mood
-        Bonus function - might be useful for iOS app too!
-        """
+    async def get_entries_by_mood(self, user_id: str, mood: str, limit: int = 20,
+                                  fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get entries filtered by specific mood, newest first"""
         try:
-            logger.info(f"Getting entries with mood '{mood}' for user {user_id}")
-            
-            # Use the existing MoodIndex if it exists, otherwise filter
-            try:
-                # Try using the MoodIndex first (more efficient)
-                response = self.journal_table.query(
-                    IndexName='MoodIndex',
-                    KeyConditionExpression='user_id = :user_id AND primary_mood = :mood',
-                    ExpressionAttributeValues={
-                        ':user_id': user_id,
-                        ':mood': mood
-                    },
-                    Limit=limit,
-                    ScanIndexForward=False  # Newest first
-                )
-                entries = response.get('Items', [])
-                
-            except ClientError:
-                # Fallback: Query all entries and filter by mood
-                logger.info("MoodIndex not available, using filter expression")
-                response = self.journal_table.query(
-                    KeyConditionExpression='user_id = :user_id',
-                    FilterExpression='primary_mood = :mood',
-                    ExpressionAttributeValues={
-                        ':user_id': user_id,
-                        ':mood': mood
-                    },
-                    Limit=limit * 2,
-                    ScanIndexForward=False
-                )
-                entries = response.get('Items', [])[:limit]
+            logger.info("Getting entries with mood '%s' for user %s", mood, user_id)
+
+            entries = []
+            async for page in self.iter_entries_by_mood(user_id, mood, limit, fields=fields):
+                entries.extend(page)
             
-            logger.info(f"Found {len(entries)} entries with mood '{mood}' for user {user_id}")
+            logger.info("Found %s entries with mood '%s' for user %s", len(entries), mood, user_id)
             return entries
             
         except ClientError as e:
-            logger.error(f"Error getting entries by mood {mood}: {e}")
+            logger.error("Error getting entries by mood %s: %s", mood, e)
             return []
         except Exception as e:
-            logger.error(f"Unexpected error getting entries by mood: {e}")
+            logger.error("Unexpected error getting entries by mood: %s", e)
             return []
 
+    async def iter_entries_by_mood(self, user_id: str, mood: str, limit: int = 20, page_size: int = 50,
+                                   fields: Optional[List[str]] = None) -> AsyncIterator[List[Dict]]:
+        """
+        Yield up to limit entries with the given mood page by page, newest first
+        MoodDateIndex (DYNAMO_NEW_INDEXES) keys entries by "<mood>#<created_at>", so one query returns
+        them in date order; MoodIndex, the index used without it, can't order by date
+        """
+        if settings.DYNAMO_NEW_INDEXES:
+            query_kwargs = {
+                'IndexName': 'MoodDateIndex',
+                'KeyConditionExpression': 'user_id = :user_id AND begins_with(mood_created_at, :mood_prefix)',
+                'ExpressionAttributeValues': {':user_id': user_id, ':mood_prefix': f'{mood}#'}
+            }
+        else:
+            query_kwargs = {
+                'IndexName': 'MoodIndex',
+                'KeyConditionExpression': 'user_id = :user_id AND primary_mood = :mood',
+                'ExpressionAttributeValues': {':user_id': user_id, ':mood': mood}
+            }
+
+        async for page in self._query_pages(
+            limit, page_size,
+            **query_kwargs,
+            ScanIndexForward=False,  # Newest first
+            **projection_kwargs(fields)
+        ):
+            yield page
+
+    async def backfill_index_keys(self) -> int:
+        """
+        One-off migration (migrations.py backfill-index-keys): add mood_created_at, created_at_ms
+        (and favorite_created_at for favorites) to entries saved before MoodDateIndex/DateMsIndex/
+        FavoritesIndex existed. Entries without them are missing from those indexes.
+        Returns the number of entries updated.
+        """
+        updated = 0
+        scan_kwargs = {
+            'ProjectionExpression': 'user_id, entry_id, primary_mood, created_at, is_favorite, '
+                                    'mood_created_at, favorite_created_at, created_at_ms'
+        }
+        while True:
+            response = await self.journal_table.scan(**scan_kwargs)
+            for item in response.get('Items', []):
+                updates = []
+                if 'mood_created_at' not in item:
+                    updates.append('mood_created_at = :mood_created_at')
+                if item.get('is_favorite') and 'favorite_created_at' not in item:
+                    updates.append('favorite_created_at = created_at')
+                if 'created_at_ms' not in item and item.get('created_at'):
+                    updates.append('created_at_ms = :created_at_ms')
+                if not updates:
+                    continue
+
+                values = {}
+                if 'mood_created_at' not in item:
+                    values[':mood_created_at'] = f"{item.get('primary_mood', 'neutral')}#{item.get('created_at', '')}"
+                if 'created_at_ms' not in item and item.get('created_at'):
+                    values[':created_at_ms'] = _iso_to_ms(item['created_at'])
+                await self.journal_table.update_item(
+                    Key={'user_id': item['user_id'], 'entry_id': item['entry_id']},
+                    UpdateExpression='SET ' + ', '.join(updates),
+                    **({'ExpressionAttributeValues': values} if values else {})
+                )
+                updated += 1
+
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            scan_kwargs['ExclusiveStartKey'] = last_key
+
+        logger.info("Backfilled index keys on %s entries", updated)
+        return updated
+
+    async def backfill_user_totals(self) -> int:
+        """
+        One-off migration (migrations.py backfill-user-totals): rebuild total_entries, total_words and mood_count_<mood> on every user
+        from their entries, for users created before the running totals existed.
+        Run while writes are quiet. Returns the number of users updated.
+        """
+        entries_by_user = {}
+        scan_kwargs = {'ProjectionExpression': 'user_id, primary_mood, word_count'}
+        while True:
+            response = await self.journal_table.scan(**scan_kwargs)
+            for item in response.get('Items', []):
+                entries_by_user.setdefault(item['user_id'], []).append(item)
+
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            scan_kwargs['ExclusiveStartKey'] = last_key
+
+        for user_id, entries in entries_by_user.items():
+            await self.users_table.update_item(Key={'user_id': user_id}, **totals_update(entries, replace=True))
+
+        logger.info("Backfilled totals on %s users", len(entries_by_user))
+        return len(entries_by_user)
+
     
-    def update_entry_favorite(self, user_id: str, entry_id: str, is_favorite: bool) -> bool:
+    async def update_entry_favorite(self, user_id: str, entry_id: str, is_favorite: bool) -> bool:
         """
         Mark/unmark entry as favorite with proper validation
         Returns True if updated, False if entry not found
         """
         try:
-            logger.info(f"Updating favorite status for entry {entry_id} to {is_favorite}")
-            
-            # First check if entry exists
-            existing_entry = self.get_entry_by_id(user_id, entry_id)
-            if not existing_entry:
-                logger.warning(f"Cannot update favorite - entry {entry_id} not found for user {user_id}")
-                return False
+            logger.info("Updating favorite status for entry %s to %s", entry_id, is_favorite)
             
-            # Update the favorite status
-            self.journal_table.update_item(
+            # No existence pre-check: the conditional update below fails for a missing entry.
+            # Update the favorite status. favorite_created_at is the FavoritesIndex sort key:
+            # present only on favorites, so the index stays sparse. is_favorite itself is kept
+            # on every entry since clients read it.
+            if is_favorite:
+                update_expression = 'SET is_favorite = :fav, updated_at = :timestamp, favorite_created_at = created_at'
+            else:
+                update_expression = 'SET is_favorite = :fav, updated_at = :timestamp REMOVE favorite_created_at'
+
+            await self.journal_table.update_item(
                 Key={'user_id': user_id, 'entry_id': entry_id},
-                UpdateExpression='SET is_favorite = :fav, updated_at = :timestamp',
+                UpdateExpression=update_expression,
                 ExpressionAttributeValues={
                     ':fav': is_favorite,
-                    ':timestamp': datetime.utcnow().isoformat() + 'Z'
+                    ':timestamp': _utc_now_iso()
                 },
                 # Ensure entry still exists when we update
                 ConditionExpression='attribute_exists(entry_id)'
             )
             
-            logger.info(f"Successfully updated favorite status for entry {entry_id}")
+            logger.info("Successfully updated favorite status for entry %s", entry_id)
             return True
             
         except ClientError as e:
             if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
-                logger.warning(f"Entry {entry_id} no longer exists")
+                logger.warning("Cannot update favorite - entry %s not found for user %s", entry_id, user_id)
                 return False
             else:
-                logger.error(f"Error updating favorite status: {e}")
+                logger.error("Error updating favorite status: %s", e)
                 raise
         except Exception as e:
-            logger.error(f"Unexpected error updating favorite status: {e}")
+            logger.error("Unexpected error updating favorite status: %s", e)
             raise
 
     
-    def delete_entry(self, user_id: str, entry_id: str) -> bool:
+    async def delete_entry(self, user_id: str, entry_id: str) -> bool:
         """
         Delete a journal entry with proper validation
         Returns True if deleted, False if not found
         """
         try:
-            logger.info(f"Attempting to delete entry {entry_id} for user {user_id}")
+            logger.info("Attempting to delete entry %s for user %s", entry_id, user_id)
             
-            # First, check if the entry exists
-            existing_entry = self.get_entry_by_id(user_id, entry_id)
-            if not existing_entry:
-                logger.warning(f"Cannot delete - entry {entry_id} not found for user {user_id}")
-                return False
-            
-            # Entry exists, now delete it
-            self.journal_table.delete_item(
+            # The totals update needs the entry's word count and mood: take them from the
+            # deleted item instead of a pre-read
+            response = await self.journal_table.delete_item(
                 Key={'user_id': user_id, 'entry_id': entry_id},
                 # Add condition to ensure we only delete if it still exists
-                ConditionExpression='attribute_exists(entry_id)'
+                ConditionExpression='attribute_exists(entry_id)',
+                ReturnValues='ALL_OLD'
             )
-            
-            logger.info(f"Successfully deleted entry {entry_id} from journal table")
-            
-            # Only decrement counter if deletion was successful
+            if not response.get('Attributes'):
+                logger.warning("Cannot delete - entry %s not found for user %s", entry_id, user_id)
+                return False
+
+            logger.info("Successfully deleted entry %s from journal table", entry_id)
+
+            # Only decrement the totals if deletion was successful, and never below zero:
+            # a retried or racing delete must not drive the counters negative
+            totals = totals_update([response['Attributes']], sign=-1)
+            totals['ExpressionAttributeValues'][':zero'] = 0
             try:
-                self.users_table.update_item(
+                await self.users_table.update_item(
                     Key={'user_id': user_id},
-                    UpdateExpression='ADD total_entries :dec',
                     ConditionExpression='total_entries > :zero',
-                    ExpressionAttributeValues={
-                        ':dec': -1,
-                        ':zero': 0
-                    }
+                    **totals
                 )
-                logger.info(f"Decremented entry count for user {user_id}")
+                logger.info("Decremented entry count for user %s", user_id)
             except ClientError as count_error:
                 # If count update fails, log but don't fail the whole operation
-                logger.warning(f"Could not update entry count for user {user_id}: {count_error}")
+                logger.warning("Could not update entry count for user %s: %s", user_id, count_error)
             
-            logger.info(f"Successfully deleted entry {entry_id} for user {user_id}")
+            logger.info("Successfully deleted entry %s for user %s", entry_id, user_id)
             return True
             
         except ClientError as e:
             if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
-                logger.warning(f"Entry {entry_id} was already deleted or doesn't exist")
+                logger.warning("Entry %s was already deleted or doesn't exist", entry_id)
                 return False
             else:
-                logger.error(f"DynamoDB error deleting entry {entry_id}: {e}")
+                logger.error("DynamoDB error deleting entry %s: %s", entry_id, e)
                 raise
         except Exception as e:
-            logger.error(f"Unexpected error deleting entry {entry_id}: {e}")
+            logger.error("Unexpected error deleting entry %s: %s", entry_id, e)
             raise
     
     # ==================================================================================
     # ANALYTICS & INSIGHTS
     # ==================================================================================
     
-    def get_mood_distribution(self, user_id: str, days: int = 30) -> Dict[str, int]:
+    async def get_mood_distribution(self, user_id: str, days: int = 30) -> Dict[str, int]:
         """Get mood distribution over the last N days"""
         try:
             # Calculate date range
@@ -479,54 +1062,54 @@ class DatabaseService:
             start_str = start_date.isoformat() + 'Z'
             end_str = end_date.isoformat() + 'Z'
             
-            entries = self.get_entries_by_date_range(user_id, start_str, end_str)
-            
-            mood_counts = {}
-            for entry in entries:
-                mood = entry.get('primary_mood', 'neutral')
-                mood_counts[mood] = mood_counts.get(mood, 0) + 1
+            # One query for the range, projected down to the mood
+            entries = await self.get_entries_by_date_range(user_id, start_str, end_str, fields=['primary_mood'])
             
-            return mood_counts
+            return dict(Counter(entry.get('primary_mood', 'neutral') for entry in entries))
         except Exception as e:
-            logger.error(f"Error calculating mood distribution: {e}")
+            logger.error("Error calculating mood distribution: %s", e)
             return {}
     
-    def get_user_stats(self, user_id: str) -> Dict:
+    async def get_user_stats(self, user_id: str) -> Dict:
 
-        """Get comprehensive user statistics"""
+        """
+        Get comprehensive user statistics
+        Served from the running totals on the user item; users whose totals predate them
+        (mood counts don't add up to total_entries) fall back to scanning recent entries
+        """
         try:
-            user = self.get_user(user_id)
+            user = await self.get_user(user_id)
             if not user:
-                return {}
-            
-            # Get recent entries for analysis
-            recent_entries = self.get_user_entries(user_id, limit=100)
+                return _user_stats(0, Counter(), 0, 0, 0)
+
+            total_entries = int(user.get('total_entries', 0))
+            mood_counts = Counter({
+                attribute[len(MOOD_COUNT_PREFIX):]: int(count)
+                for attribute, count in user.items()
+                if attribute.startswith(MOOD_COUNT_PREFIX) and count > 0
+            })
+            if sum(mood_counts.values()) == total_entries:
+                # The recent window is the newest RECENT_STATS_LIMIT entries, so its size follows from the total
+                return _user_stats(
+                    total_entries, mood_counts, int(user.get('total_words', 0)),
+                    total_entries, min(total_entries, RECENT_STATS_LIMIT)
+                )
             
-            if not recent_entries:
-                return {
-                    'total_entries': user.get('total_entries', 0),
-                    'mood_distribution': {},
-                    'avg_word_count': 0,
-                    'writing_streak': 0
-                }
+            # Get recent entries for analysis: only the two attributes the stats read, not the stories
+            recent_entries = await self.get_user_entries(
+                user_id, limit=RECENT_STATS_LIMIT, fields=['primary_mood', 'word_count']
+            )
             
-            # Calculate stats
-            total_words = sum(entry.get('word_count', 0) for entry in recent_entries)
-            avg_word_count = total_words // len(recent_entries) if recent_entries else 0
-            
-            mood_dist = {}
-            for entry in recent_entries:
-                mood = entry.get('primary_mood', 'neutral')
-                mood_dist[mood] = mood_dist.get(mood, 0) + 1
-            
-            return {
-                'total_entries': user.get('total_entries', 0),
-                'mood_distribution': mood_dist,
-                'avg_word_count': avg_word_count,
-                'recent_entries_count': len(recent_entries),
-                'most_common_mood': max(mood_dist.items(), key=lambda x: x[1])[0] if mood_dist else 'neutral'
-            }
+            # Calculate stats. The low-level read path deserializes word counts to int already
+            return _user_stats(
+                total_entries,
+                Counter(map(_PRIMARY_MOOD, recent_entries)),
+                sum(map(_WORD_COUNT, recent_entries)),
+                len(recent_entries),
+                len(recent_entries)
+            )
             
         except Exception as e:
-            logger.error(f"Error calculating user stats: {e}")
-            return {}
\ No newline at end of file
+            # Raise rather than return a differently shaped body; the route turns this into a 500
+            logger.error("Error calculating user stats: %s", e)
+            raise
\ No newline at end of file
@@ -0,0 +1,24 @@
+import functools
+import httpx
+from openai import AsyncAzureOpenAI
+from config.settings import settings
+
+# One connection pool shared by every model tool, so keep-alive connections to the
+# Azure OpenAI endpoint are reused across tools and requests instead of each client
+# paying its own TCP and TLS handshakes.
+# An async client: requests are awaited on the event loop, so concurrent completions
+# don't each hold a worker thread for the whole model round-trip.
+SHARED_HTTP = httpx.AsyncClient(
+    timeout=60.0,
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=300)
+)
+
+@functools.cache
+def get_azure_client() -> AsyncAzureOpenAI:
+    """The AsyncAzureOpenAI client every tool shares, created on first use"""
+    return AsyncAzureOpenAI(
+        api_version="2025-01-01-preview",
+        azure_endpoint="https://memoir-ai-resource.cognitiveservices.azure.com/",
+        api_key=settings.OPENAI_API_KEY,
+        http_client=SHARED_HTTP
+    )
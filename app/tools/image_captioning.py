@@ -1,16 +1,61 @@
 import asyncio
-from openai import AzureOpenAI
+import base64
 from config.settings import settings
+from tools.cache import TTLCache, content_key
+from tools.http_client import get_azure_client
+
+def decode_image_data(image_data: str) -> bytes:
+    """Strictly decode base64 image data, raising ValueError (binascii.Error) if it is malformed"""
+    return base64.b64decode(image_data, validate=True)
+
+def encode_image_data(image_bytes: bytes) -> str:
+    """Base64-encode raw image bytes for a data URL"""
+    return base64.b64encode(image_bytes).decode('ascii')
+
+MAX_CONCURRENT_CAPTIONS = 8
 
 class ImageCaptioningTool:
-    def __init__(self):
-        self.client = AzureOpenAI(
-            api_version="2025-01-01-preview",
-            azure_endpoint="https://memoir-ai-resource.cognitiveservices.azure.com/",
-            api_key=settings.OPENAI_API_KEY
-        )
-
-    async def caption_image(self, image_data: str, image_format: str):
+    def __init__(self, model: str = None):
+        self.client = get_azure_client()
+        self.model = model or settings.CAPTION_MODEL
+        # Retries and re-submissions of the same photo skip the vision model
+        self._cache = TTLCache(maxsize=4096, ttl=3600)
+        # Cap concurrent vision calls so a many-image batch can't trip upstream rate limits
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_CAPTIONS)
+
+    async def caption_image(self, image_data: str, image_format: str, image_bytes: bytes = None):
+        """
+        Caption a base64-encoded image.
+        Callers that already decoded image_data can pass image_bytes to skip a second decode.
+        """
+        if image_bytes is None:
+            try:
+                image_bytes = decode_image_data(image_data)
+            except ValueError as e:
+                return f"Error: invalid base64 image data ({str(e)})"
+
+        # Key on the decoded bytes: a quarter smaller than the base64 text and no str->bytes copy
+        cache_key = content_key(self.model, image_format, image_bytes)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        return await self._caption(f"data:image/{image_format};base64,{image_data}", cache_key)
+
+    async def caption_image_url(self, image_url: str):
+        """
+        Caption an image the model can fetch itself (e.g. a presigned S3 URL),
+        so the image bytes never pass through this service or a base64 data URL
+        """
+        cache_key = content_key(self.model, image_url)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        return await self._caption(image_url, cache_key)
+
+    async def _caption(self, url: str, cache_key: str):
+        """Run the vision model on an image URL (data: or https:) and cache the caption"""
         try:
             messages = [
                 {
@@ -26,21 +71,31 @@ class ImageCaptioningTool:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/{image_format};base64,{image_data}"
+                                "url": url
                             }
                         }
                     ]
                 }
             ]
 
-            response = self.client.chat.completions.create(
-                messages = messages,
-                model="gpt-4o",
-                max_tokens = 300
-            )
+            async with self._semaphore:
+                response = await self.client.chat.completions.create(
+                    messages = messages,
+                    model=self.model,
+                    max_tokens = 80  # 1-2 sentences
+                )
 
-            
-
-            return response.choices[0].message.content
+            caption = response.choices[0].message.content
+            self._cache.set(cache_key, caption)
+            return caption
         except Exception as e:
-            return f"Error: {str(e)}"
\ No newline at end of file
+            return f"Error: {str(e)}"
+
+    async def batch_caption_images(self, images: list):
+        """
+        Caption a batch of (image_data, image_format) or (image_data, image_format, image_bytes)
+        tuples, returning captions in order.
+        One caption per completion keeps each result independently cacheable and retryable,
+        so the batch fans out concurrently (bounded by MAX_CONCURRENT_CAPTIONS).
+        """
+        return await asyncio.gather(*(self.caption_image(*image) for image in images))
@@ -0,0 +1,50 @@
+import io
+import logging
+from typing import List, Optional
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Hashes within this many differing bits are treated as the same shot (burst photos, re-exports)
+NEAR_DUPLICATE_DISTANCE = 5
+
+def dhash(image_bytes: bytes, hash_size: int = 8) -> Optional[int]:
+    """
+    64-bit difference hash: shrink to (hash_size+1) x hash_size greyscale and
+    record whether each pixel is brighter than its right-hand neighbour.
+    Returns None if Pillow can't decode the image.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            # Lets the JPEG decoder scale down while decoding instead of inflating the full image
+            image.draft('L', (hash_size * 8, hash_size * 8))
+            pixels = list(image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        logger.warning("Could not hash image: %s", e)
+        return None
+
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+def group_near_duplicates(hashes: List[Optional[int]], max_distance: int = NEAR_DUPLICATE_DISTANCE) -> List[int]:
+    """
+    Map each image to the index of the first earlier image it nearly duplicates (itself if none).
+    Images that couldn't be hashed always stand alone.
+    """
+    representatives = []
+    groups = []
+    for i, image_hash in enumerate(hashes):
+        match = i
+        if image_hash is not None:
+            for rep in representatives:
+                if (hashes[rep] ^ image_hash).bit_count() <= max_distance:
+                    match = rep
+                    break
+            else:
+                representatives.append(i)
+        groups.append(match)
+    return groups
@@ -1,21 +1,52 @@
 import asyncio
-from openai import AzureOpenAI
 from config.settings import settings
+from tools.cache import TTLCache, content_key
+from tools.http_client import get_azure_client
 import json
 
+MOODS = ['joyful', 'nostalgic', 'adventurous', 'peaceful', 'melancholic', 'excited', 'grateful', 'reflective']
+
+# Structured outputs constrain sampling to this schema, so the reply is always bare JSON with
+# a mood from the list. Strict mode doesn't allow numeric bounds; the 1-10 range is in the prompt.
+SENTIMENT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "sentiment_analysis",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "primary_mood": {"type": "string", "enum": MOODS},
+                "secondary_moods": {"type": "array", "items": {"type": "string"}},
+                "emotional_intensity": {"type": "integer"},
+                "themes": {"type": "array", "items": {"type": "string"}},
+                "overall_sentiment": {"type": "string", "enum": ["positive", "negative", "neutral"]}
+            },
+            "required": ["primary_mood", "secondary_moods", "emotional_intensity", "themes", "overall_sentiment"],
+            "additionalProperties": False
+        }
+    }
+}
+
 class StoryAnalysisTool:
-    def __init__(self):
-        self.client = AzureOpenAI(
-            api_version="2025-01-01-preview",
-            azure_endpoint="https://memoir-ai-resource.cognitiveservices.azure.com/",
-            api_key=settings.OPENAI_API_KEY
-        )
+    def __init__(self, model: str = None, title_model: str = None):
+        self.client = get_azure_client()
+        self.model = model or settings.SENTIMENT_MODEL
+        self.title_model = title_model or settings.TITLE_MODEL
+        # Identical stories (client retries, re-analysis) are answered from memory
+        self._sentiment_cache = TTLCache(maxsize=4096, ttl=3600)
+        self._title_cache = TTLCache(maxsize=4096, ttl=3600)
 
     async def analyze_story_sentiment(self, story_content: str):
         """
         Analyze the emotional tone and themes of a journal entry
         Returns structured data about mood, themes and emotional intensity
         """
+        cache_key = content_key(self.model, story_content)
+        cached = self._sentiment_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
         try:
             prompt = f"""Analyze this journey entry and provide a detailed sentiment analysis in JSON format:
 
@@ -30,8 +61,6 @@ class StoryAnalysisTool:
             - emotional_intensity: scale 1-10 (1=very mild, 10=very intense)
             - themes: array of key themes (family, travel, achievement, nature, friendship, etc.)
             - overall_sentiment: positive, negative, or neutral
-
-            IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks, no additional text.
             """
 
             messages = [
@@ -41,14 +70,17 @@ class StoryAnalysisTool:
                 }
             ]
 
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 messages = messages,
-                model="gpt-4o",
+                model=self.model,
                 max_tokens = 300,
-                temperature=0.3
+                temperature=0.3,
+                response_format=SENTIMENT_RESPONSE_FORMAT
             )
+            # Still parsed defensively: a reply cut off at max_tokens is not valid JSON
             analysis = json.loads(response.choices[0].message.content)
-            return analysis
+            self._sentiment_cache.set(cache_key, analysis)
+            return dict(analysis)
         
         except json.JSONDecodeError:
             return {
@@ -60,7 +92,7 @@ class StoryAnalysisTool:
             }
         except Exception as e:
             return {"error": f"Analysis failed: {str(e)}"}
-        
+
     async def generate_story_title(self, story_content: str, sentiment_data: dict = None):
         """
         Create a compelling, personalized title for journal entries
@@ -71,6 +103,11 @@ class StoryAnalysisTool:
             if sentiment_data and "primary_mood" in sentiment_data:
                 mood_context = f"The story has a {sentiment_data['primary_mood']} mood. "
 
+            cache_key = content_key(self.title_model, mood_context, story_content)
+            cached = self._title_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
             prompt = f"""Create an engaging title for this journal entry. {mood_context}
 
             Story: {story_content}
@@ -99,14 +136,15 @@ class StoryAnalysisTool:
                 }
             ]
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o", 
+            response = await self.client.chat.completions.create(
+                model=self.title_model,
                 messages=messages,
-                max_tokens=200,
+                max_tokens=60,  # 3-8 words
                 temperature=0.6  # Slightly higher temperature for creativity
             )
 
             title = response.choices[0].message.content
+            self._title_cache.set(cache_key, title)
             return title
 
         except Exception as e:
@@ -1,39 +1,79 @@
 import asyncio
-from openai import AzureOpenAI
+from typing import AsyncIterator
 from config.settings import settings
+from tools.cache import TTLCache, content_key
+from tools.http_client import get_azure_client
 
 class StoryGenerationTool():
-    def __init__(self):
-        self.client = AzureOpenAI(
-            api_version="2025-01-01-preview",
-            azure_endpoint="https://memoir-ai-resource.cognitiveservices.azure.com/",
-            api_key=settings.OPENAI_API_KEY
-        )
+    def __init__(self, model: str = None):
+        self.client = get_azure_client()
+        self.model = model or settings.STORY_MODEL
+        # Same captions, context and tone (e.g. a retried memoir) reuse the story
+        self._cache = TTLCache(maxsize=4096, ttl=3600)
+
 
+    def _story_messages(self, captions: list, user_context: str, tone: str) -> list:
+        captions_text = "\n".join(captions)
+        prompt = f"""Create a {tone} journal entry from these image descriptions:
+        {captions_text}
+        More context from the user: {user_context}
+        Write a short, meaningful entry summarizes how the user's day went
+        Return only the story itself, with paragraphs seperated by a newline.
+        IMPORTANT: do not add a title or a date field
+        """
+        return [
+            {
+                "role":"user",
+                "content": prompt
+            }
+        ]
 
     async def generate_story(self, captions: list, user_context: str = "", tone: str="heartwarming"):
+        # Captions stay in upload order: the story follows the photos' sequence
+        cache_key = content_key(self.model, tone, user_context, *captions)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         try:
-            captions_text = "\n".join(captions)
-            prompt = f"""Create a {tone} journal entry from these image descriptions:
-            {captions_text}
-            More context from the user: {user_context}
-            Write a short, meaningful entry summarizes how the user's day went
-            Return only the story itself, with paragraphs seperated by a newline.
-            IMPORTANT: do not add a title or a date field
-            """
-            messages = [
-                {
-                    "role":"user",
-                    "content": prompt
-                }
-            ]
-        
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages = messages,
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages = self._story_messages(captions, user_context, tone),
                 max_tokens = 300
             )
-            return response.choices[0].message.content
+            story = response.choices[0].message.content
+            self._cache.set(cache_key, story)
+            return story
         except Exception as e:
             return f"Error: {str(e)}"
 
+    async def stream_story(self, captions: list, user_context: str = "", tone: str="heartwarming") -> AsyncIterator[str]:
+        """
+        Yield the story as the model produces it, so callers can forward text before generation ends.
+        The completed story lands in the same cache as generate_story; a cached story is yielded whole.
+        Unlike generate_story, failures raise instead of returning an "Error: ..." string,
+        since part of the story may already have been yielded.
+        """
+        cache_key = content_key(self.model, tone, user_context, *captions)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=self._story_messages(captions, user_context, tone),
+            max_tokens=300,
+            stream=True
+        )
+        parts = []
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            # If the consumer went away early, drop the connection instead of draining it
+            await stream.close()
+
+        self._cache.set(cache_key, "".join(parts))